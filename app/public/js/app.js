@@ -29,6 +29,12 @@ const markersLayer = L.markerClusterGroup({
 	chunkDelay: 100,
 }).addTo(map);
 
+// Layer cluster dari server (/api/map), dipakai saat fleet terlalu besar untuk marker per node
+const serverClusterLayer = L.layerGroup().addTo(map);
+const MAP_SERVER_CLUSTER_THRESHOLD = 2000;
+let serverClusterMode = false;
+let mapViewportRequest = 0;
+
 // --- GLOBAL VARS ---
 let currentMachines = [];
 let markerMap = {};
@@ -45,6 +51,11 @@ let itemsPerPage = 6;
 let currentViewMode = "normal";
 let configLatency = 100; // Default
 let configBandwidth = 10000; // Default
+let lastStatusEtag = null; // ETag /api/status terakhir yang sudah dirender
+let statusSeq = null; // Versi data terakhir dari backend, dipakai untuk delta
+let statusStream = null; // EventSource /api/stream
+let streamConnected = false; // Selama stream hidup, polling dimatikan
+const STATUS_HISTORY_LEN = 60;
 
 // [BARU] Variable untuk HQ (Server Pusat)
 let hqLocation = null; // { lat, lng, city, ip, org }
@@ -239,6 +250,30 @@ window.toggleNotifications = function () {
 	dropdown.style.display = dropdown.style.display === "none" ? "block" : "none";
 };
 
+// Alert yang sedang ditampilkan (terbaru dulu) & cursor halaman berikutnya (lebih lama)
+let notifItems = [];
+let notifNextCursor = null;
+let notifLoadingOlder = false;
+
+function renderNotifItem(a) {
+	const icon =
+		a.type === "down"
+			? '<i class="fas fa-exclamation-circle" style="color:#ef4444"></i>'
+			: a.type === "flap"
+				? '<i class="fas fa-random" style="color:#f97316"></i>'
+				: a.type === "rule"
+					? '<i class="fas fa-sliders-h" style="color:#8b5cf6"></i>'
+					: a.type === "anomaly"
+						? '<i class="fas fa-wave-square" style="color:#0ea5e9"></i>'
+						: '<i class="fas fa-tachometer-alt" style="color:#f59e0b"></i>';
+	return `<div class="notif-item ${a.is_read ? "" : "unread"}"><div style="font-weight:700; margin-bottom:2px; font-size:0.8rem; display:flex; align-items:center; gap:6px;">${icon} ${a.machine_id}</div><div style="color:#334155;">${a.message}</div><span class="notif-time">${a.time}</span></div>`;
+}
+
+function resetNotifications() {
+	notifItems = [];
+	notifNextCursor = null;
+}
+
 async function fetchNotifications() {
 	try {
 		const res = await fetch("/api/alerts");
@@ -247,26 +282,57 @@ async function fetchNotifications() {
 		const badge = document.getElementById("notif-badge");
 		badge.style.display = data.unread_count > 0 ? "block" : "none";
 		const list = document.getElementById("notif-list");
-		if (data.alerts.length === 0) {
+
+		// Pertahankan halaman lama hasil scroll jika masih menyambung dengan halaman pertama
+		const firstIds = new Set(data.alerts.map((a) => a.id));
+		const overlaps = notifItems.some((a) => firstIds.has(a.id));
+		if (data.alerts.length && overlaps && notifItems.length > data.alerts.length) {
+			const oldest = data.alerts[data.alerts.length - 1].id;
+			notifItems = data.alerts.concat(notifItems.filter((a) => a.id < oldest));
+		} else {
+			notifItems = data.alerts;
+			notifNextCursor = data.next_cursor;
+		}
+
+		if (notifItems.length === 0) {
 			list.innerHTML = `<div style="padding:15px; text-align:center; color:#94a3b8; font-size:0.85rem;">Tidak ada notifikasi</div>`;
 			return;
 		}
-		list.innerHTML = "";
-		data.alerts.forEach((a) => {
-			const icon =
-				a.type === "down"
-					? '<i class="fas fa-exclamation-circle" style="color:#ef4444"></i>'
-					: '<i class="fas fa-tachometer-alt" style="color:#f59e0b"></i>';
-			const html = `<div class="notif-item ${a.is_read ? "" : "unread"}"><div style="font-weight:700; margin-bottom:2px; font-size:0.8rem; display:flex; align-items:center; gap:6px;">${icon} ${a.machine_id}</div><div style="color:#334155;">${a.message}</div><span class="notif-time">${a.time}</span></div>`;
-			list.insertAdjacentHTML("beforeend", html);
-		});
+		list.innerHTML = notifItems.map(renderNotifItem).join("");
+	} catch (e) {
+		console.error(e);
+	}
+}
+
+// Scroll ke bawah daftar notifikasi memuat alert yang lebih lama (keyset ?before=)
+async function loadOlderNotifications() {
+	if (!notifNextCursor || notifLoadingOlder) return;
+	notifLoadingOlder = true;
+	try {
+		const res = await fetch(`/api/alerts?before=${notifNextCursor}`);
+		if (!res.ok) return;
+		const data = await res.json();
+		notifItems = notifItems.concat(data.alerts);
+		notifNextCursor = data.next_cursor;
+		document
+			.getElementById("notif-list")
+			.insertAdjacentHTML("beforeend", data.alerts.map(renderNotifItem).join(""));
 	} catch (e) {
 		console.error(e);
+	} finally {
+		notifLoadingOlder = false;
 	}
 }
 
+document.getElementById("notif-list").addEventListener("scroll", (e) => {
+	const el = e.target;
+	if (el.scrollTop + el.clientHeight >= el.scrollHeight - 40)
+		loadOlderNotifications();
+});
+
 window.markRead = async function () {
 	await fetch("/api/alerts/read", { method: "POST" });
+	resetNotifications();
 	fetchNotifications();
 };
 
@@ -275,6 +341,7 @@ window.clearNotifications = async function () {
 	try {
 		const res = await fetch("/api/alerts/clear", { method: "POST" });
 		if (res.ok) {
+			resetNotifications();
 			fetchNotifications();
 			showToast("Notifikasi dihapus", "success");
 		} else {
@@ -458,37 +525,122 @@ async function loadStatus() {
 	try {
 		await loadSettings();
 
-		const res = await fetch("/api/status");
+		// Load pertama ambil data lengkap, selanjutnya hanya perubahan sejak statusSeq
+		const url =
+			statusSeq === null ? "/api/status" : `/api/status?since=${statusSeq}`;
+		const res = await fetch(url, { cache: "no-cache" });
 		if (res.status === 401) window.location.reload();
 		if (!res.ok) return;
-		const data = await res.json();
-
-		if (!Array.isArray(data)) return;
-
-		data.sort((a, b) => {
-			const provA = a.province || "zzz";
-			const provB = b.province || "zzz";
-			if (provA !== provB) return provA.localeCompare(provB);
-			const cityA = a.city || "zzz";
-			const cityB = b.city || "zzz";
-			if (cityA !== cityB) return cityA.localeCompare(cityB);
-			return a.id.localeCompare(b.id);
-		});
 
-		currentMachines = data;
-		updateFilters(data);
-		applyFilters(false);
-		renderMap(data);
+		// Backend menjawab 304 jika data belum berubah; tidak perlu render ulang
+		const etag = res.headers.get("ETag");
+		if (etag && etag === lastStatusEtag) return;
+		lastStatusEtag = etag;
 
-		if (openedPopupId) {
-			const m = currentMachines.find((x) => x.id === openedPopupId);
-			if (m && mapChartInstances[openedPopupId]) updateMapChart(m);
-		}
+		const payload = await res.json();
+		applyStatusPayload(payload, res.headers.get("X-Status-Seq"));
 	} catch (err) {
 		console.error(err);
 	}
 }
 
+// Render payload /api/status (list penuh, objek full, atau delta)
+function applyStatusPayload(payload, headerSeq = null) {
+	let data;
+	if (Array.isArray(payload)) {
+		data = payload;
+		const seq = parseInt(headerSeq);
+		statusSeq = isNaN(seq) ? null : seq;
+	} else if (payload && payload.full) {
+		data = payload.machines;
+		statusSeq = payload.seq;
+	} else if (payload && Array.isArray(payload.machines)) {
+		data = mergeStatusDelta(payload);
+		statusSeq = payload.seq;
+	} else {
+		return;
+	}
+
+	data.sort((a, b) => {
+		const provA = a.province || "zzz";
+		const provB = b.province || "zzz";
+		if (provA !== provB) return provA.localeCompare(provB);
+		const cityA = a.city || "zzz";
+		const cityB = b.city || "zzz";
+		if (cityA !== cityB) return cityA.localeCompare(cityB);
+		return a.id.localeCompare(b.id);
+	});
+
+	currentMachines = data;
+	updateFilters(data);
+	applyFilters(false);
+	renderMap(data);
+
+	if (openedPopupId) {
+		const m = currentMachines.find((x) => x.id === openedPopupId);
+		if (m && mapChartInstances[openedPopupId]) updateMapChart(m);
+	}
+}
+
+// --- LIVE UPDATE (SSE) ---
+// Backend push delta status & alert baru; polling hanya jalan saat stream putus
+function connectStatusStream() {
+	if (!window.EventSource || statusStream) return;
+
+	const url =
+		statusSeq === null ? "/api/stream" : `/api/stream?since=${statusSeq}`;
+	statusStream = new EventSource(url);
+
+	statusStream.onopen = () => {
+		streamConnected = true;
+	};
+	statusStream.addEventListener("status", (e) => {
+		try {
+			applyStatusPayload(JSON.parse(e.data));
+		} catch (err) {
+			console.error(err);
+		}
+	});
+	statusStream.addEventListener("alert", () => fetchNotifications());
+	statusStream.onerror = () => {
+		// EventSource reconnect otomatis (dengan Last-Event-ID); sementara itu polling aktif
+		streamConnected = false;
+		if (statusStream.readyState === EventSource.CLOSED) statusStream = null;
+	};
+}
+
+// Gabungkan delta /api/status ke currentMachines
+function mergeStatusDelta(delta) {
+	const byId = {};
+	currentMachines.forEach((m) => (byId[m.id] = m));
+
+	delta.removed.forEach((id) => delete byId[id]);
+	delta.machines.forEach((m) => (byId[m.id] = m));
+
+	Object.entries(delta.samples).forEach(([id, samples]) => {
+		const m = byId[id];
+		if (!m) return;
+		// Lewati sample yang sudah dimiliki (delta dari polling & stream bisa tumpang tindih)
+		const lastTime = m.history.length
+			? m.history[m.history.length - 1].time
+			: "";
+		samples = samples.filter((s) => s.time > lastTime);
+		if (samples.length === 0) return;
+		m.history = m.history.concat(samples).slice(-STATUS_HISTORY_LEN);
+
+		// State terakhir node = sample terbaru
+		const last = samples[samples.length - 1];
+		const isOnline = last.status === "ONLINE";
+		m.online = isOnline ? 1 : 0;
+		m.latency_ms = isOnline ? last.latency : 0;
+		m.rx_rate = isOnline ? last.rx : 0;
+		m.tx_rate = isOnline ? last.tx : 0;
+		m.last_seen = last.time;
+	});
+
+	return Object.values(byId);
+}
+
 async function loadSettings() {
 	try {
 		const res = await fetch("/api/settings");
@@ -860,6 +1012,22 @@ function renderMap(data) {
 	// [BARU] Bersihkan dan gambar ulang garis koneksi
 	connectionLinesLayer.clearLayers();
 
+	// Fleet besar: marker & cluster dihitung server hanya untuk viewport aktif
+	if (data.length > MAP_SERVER_CLUSTER_THRESHOLD) {
+		if (!serverClusterMode) {
+			serverClusterMode = true;
+			markersLayer.clearLayers();
+			markerMap = {};
+		}
+		renderHQMarker();
+		loadMapViewport();
+		return;
+	}
+	if (serverClusterMode) {
+		serverClusterMode = false;
+		serverClusterLayer.clearLayers();
+	}
+
 	// Pastikan Marker HQ selalu ada (jika data sudah di-fetch)
 	renderHQMarker();
 
@@ -994,6 +1162,75 @@ function renderMap(data) {
 	});
 }
 
+async function loadMapViewport() {
+	const requestId = ++mapViewportRequest;
+	const b = map.getBounds();
+	const bbox = [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()]
+		.map((v) => v.toFixed(5))
+		.join(",");
+
+	try {
+		const res = await fetch(`/api/map?bbox=${bbox}&zoom=${map.getZoom()}`);
+		if (!res.ok) return;
+		const data = await res.json();
+		// Abaikan respons lama jika peta sudah digeser lagi
+		if (requestId !== mapViewportRequest || !serverClusterMode) return;
+		renderServerClusters(data.clusters);
+	} catch (e) {
+		console.error(e);
+	}
+}
+
+function renderServerClusters(clusters) {
+	serverClusterLayer.clearLayers();
+	const sizeClass = {
+		online: "marker-cluster-small",
+		warning: "marker-cluster-medium",
+		offline: "marker-cluster-large",
+	};
+
+	clusters.forEach((c) => {
+		if (c.count === 1) {
+			const markerClass = !c.online
+				? "status-offline"
+				: c.status === "warning"
+					? "status-warning"
+					: "status-online";
+			const icon = L.divIcon({
+				className: "custom-marker",
+				html: `<div class="marker-wrapper"><div class="marker-icon ${markerClass}"><i class="fas ${c.icon || "fa-server"}"></i></div><div class="marker-name">${c.id}</div></div>`,
+				iconSize: [44, 44],
+				iconAnchor: [22, 22],
+			});
+			L.marker([c.lat, c.lng], { icon: icon })
+				.on("click", () => openDetailModal(c.id, "status"))
+				.addTo(serverClusterLayer);
+			return;
+		}
+
+		const icon = L.divIcon({
+			className: `marker-cluster ${sizeClass[c.status]}`,
+			html: `<div><span>${c.count}</span></div>`,
+			iconSize: [40, 40],
+		});
+		L.marker([c.lat, c.lng], {
+			icon: icon,
+			title: `${c.count} node, ${c.offline} offline`,
+		})
+			.on("click", () =>
+				map.fitBounds([
+					[c.bounds[0], c.bounds[1]],
+					[c.bounds[2], c.bounds[3]],
+				]),
+			)
+			.addTo(serverClusterLayer);
+	});
+}
+
+map.on("moveend", () => {
+	if (serverClusterMode) loadMapViewport();
+});
+
 // ==========================================
 // [PERBAIKAN] LOGIKA RENDER & UPDATE DAFTAR
 // ==========================================
@@ -1421,72 +1658,82 @@ window.updateDetailView = async function () {
 		const res = await fetch("/api/history", {
 			method: "POST",
 			headers: { "Content-Type": "application/json" },
-			body: JSON.stringify({ id: currentDetailId, minutes: rangeMinutes }),
+			body: JSON.stringify({
+				id: currentDetailId,
+				minutes: rangeMinutes,
+				// Backend men-downsample ke kira-kira satu titik per pixel chart
+				max_points: Math.max(200, cw.clientWidth || 800),
+				metric: metric,
+				format: "binary",
+			}),
 		});
-		const hData = await res.json();
+		const { header, series } = decodeColumnar(await res.arrayBuffer());
+		const h = series[0];
+		const offlineCode = header.status_dict.indexOf("OFFLINE");
+		const times = Array.from(h.t, (t) => formatSeriesTime(h.base, t));
 		document.getElementById("chartLoading").style.display = "none";
 		if (metric === "status") {
 			tb.innerHTML = "";
 			const distinct = [];
 			let last = null;
-			hData.forEach((h) => {
-				if (h.status !== last) {
-					distinct.push(h);
-					last = h.status;
+			for (let i = 0; i < h.n; i++) {
+				if (h.status[i] !== last) {
+					distinct.push(i);
+					last = h.status[i];
 				}
-			});
+			}
 			const rev = distinct.reverse();
 			if (rev.length === 0) {
 				tb.innerHTML =
 					'<tr><td colspan="3" style="text-align:center;">Belum ada perubahan.</td></tr>';
 			} else {
-				rev.forEach((h) => {
-					const iso = h.status === "ONLINE";
+				rev.forEach((i) => {
+					const status = header.status_dict[h.status[i]];
+					const iso = status === "ONLINE";
 					const cls = iso ? "log-online" : "log-offline";
-					const lat = h.latency ? `${h.latency} ms` : "-";
+					const lat = h.latency[i] ? `${round2(h.latency[i])} ms` : "-";
 					const det = iso
 						? m.use_snmp
-							? `Latency: ${lat} | DL: ${h.rx || 0}K / UL: ${h.tx || 0}K`
+							? `Latency: ${lat} | DL: ${round2(h.rx[i])}K / UL: ${round2(h.tx[i])}K`
 							: `Latency: ${lat}`
 						: `Unreachable`;
-					const row = `<tr><td>${h.time}</td><td><span class="log-badge ${cls}">${h.status}</span></td><td style="color:#64748b;">${det}</td></tr>`;
+					const row = `<tr><td>${times[i]}</td><td><span class="log-badge ${cls}">${status}</span></td><td style="color:#64748b;">${det}</td></tr>`;
 					tb.insertAdjacentHTML("beforeend", row);
 				});
 			}
 			return;
 		}
 		if (detailChartInstance) detailChartInstance.destroy();
-		const labels = hData.map((h) =>
-			rangeMinutes > 1440 ? h.time : h.time.split(" ")[1],
+		const labels = times.map((t) =>
+			rangeMinutes > 1440 ? t : t.split(" ")[1],
 		);
+		// Typed array langsung dipetakan ke dataset (OFFLINE = null agar garis terputus)
+		const toDataset = (values) =>
+			Array.from(values, (v, i) =>
+				h.status[i] === offlineCode ? null : round2(v),
+			);
 		const datasets = [];
 		if (metric === "latency")
 			datasets.push({
 				label: "Latency",
-				data: hData.map((h) =>
-					h.status === "OFFLINE" ? null : getSafeValue(h, "latency"),
-				),
+				data: toDataset(h.latency),
 				borderColor: "#2563eb",
 				backgroundColor: "rgba(37,99,235,0.1)",
 				fill: true,
 				tension: 0.2,
-				pointRadius: hData.length > 100 ? 0 : 3,
+				pointRadius: h.n > 100 ? 0 : 3,
 			});
 		else if (metric === "bandwidth" && m.use_snmp) {
 			datasets.push({
 				label: "DL",
-				data: hData.map((h) =>
-					h.status === "OFFLINE" ? null : getSafeValue(h, "rx"),
-				),
+				data: toDataset(h.rx),
 				borderColor: "#10b981",
 				tension: 0.2,
 				pointRadius: 0,
 			});
 			datasets.push({
 				label: "UL",
-				data: hData.map((h) =>
-					h.status === "OFFLINE" ? null : getSafeValue(h, "tx"),
-				),
+				data: toDataset(h.tx),
 				borderColor: "#8b5cf6",
 				tension: 0.2,
 				pointRadius: 0,
@@ -1509,6 +1756,51 @@ window.updateDetailView = async function () {
 	}
 };
 
+// --- COLUMNAR HISTORY (format biner dari backend) ---
+const columnarDecoder = new TextDecoder();
+
+// Frame: "RPC1" | uint32 panjang header | header JSON | blok series.
+// Blok series: uint32 t[n], float32 latency[n], rx[n], tx[n], uint8 status[n] (+padding 4)
+function decodeColumnar(buffer) {
+	const view = new DataView(buffer);
+	const magic = columnarDecoder.decode(new Uint8Array(buffer, 0, 4));
+	if (magic !== "RPC1") throw new Error("Format history tidak dikenal");
+
+	const headerLen = view.getUint32(4, true);
+	const header = JSON.parse(
+		columnarDecoder.decode(new Uint8Array(buffer, 8, headerLen)),
+	);
+
+	let offset = 8 + headerLen;
+	const take = (Type, n) => {
+		const arr = new Type(buffer, offset, n);
+		offset += arr.byteLength;
+		return arr;
+	};
+	const series = header.series.map((s) => {
+		const t = take(Uint32Array, s.n);
+		const latency = take(Float32Array, s.n);
+		const rx = take(Float32Array, s.n);
+		const tx = take(Float32Array, s.n);
+		const status = take(Uint8Array, s.n);
+		offset += (4 - (s.n % 4)) % 4;
+		return { base: s.base, n: s.n, t, latency, rx, tx, status };
+	});
+	return { header, series };
+}
+
+// Epoch dari backend adalah wall clock server, jadi diformat sebagai UTC
+function formatSeriesTime(base, offset) {
+	return new Date((base + offset) * 1000)
+		.toISOString()
+		.replace("T", " ")
+		.slice(0, 19);
+}
+
+function round2(v) {
+	return Math.round(v * 100) / 100;
+}
+
 window.openAddModal = function (lat = 0, lng = 0) {
 	document.getElementById("addLat").value = parseFloat(lat).toFixed(6);
 	document.getElementById("addLng").value = parseFloat(lng).toFixed(6);
@@ -1804,8 +2096,10 @@ window.onclick = function (e) {
 };
 
 setInterval(() => {
+	if (statusStream === null) connectStatusStream();
+	if (streamConnected) return;
 	loadStatus();
 	fetchNotifications();
 }, 3000);
-loadStatus();
+loadStatus().then(connectStatusStream);
 fetchNotifications();
@@ -153,40 +153,134 @@ app.get("/", ensureAuthenticated, preventCache, (req, res) => {
 	res.sendFile(path.join(__dirname, "public", "dashboard.html"));
 });
 
+// Header yang diteruskan apa adanya antara browser dan backend (ETag, gzip, dst)
+const FORWARD_REQUEST_HEADERS = ["if-none-match", "accept-encoding", "accept"];
+const FORWARD_RESPONSE_HEADERS = [
+	"content-type",
+	"content-encoding",
+	"etag",
+	"vary",
+	"cache-control",
+	"x-status-seq",
+];
+
+// Header identitas user untuk backend Python
+function buildUserHeaders(req) {
+	const headers = {};
+
+	if (req.session.user) {
+		headers["X-User-Role"] = req.session.user.role || "user";
+
+		const groups = req.session.user.groups || [];
+		headers["X-User-Groups"] = JSON.stringify(groups);
+
+		headers["X-User-Name"] =
+			req.session.user.preferred_username ||
+			req.session.user.email ||
+			req.session.user.sub ||
+			"unknown";
+	}
+	return headers;
+}
+
 const proxy = async (method, path, req, res) => {
 	try {
-		const headers = {};
-
-		if (req.session.user) {
-			headers["X-User-Role"] = req.session.user.role || "user";
+		const headers = buildUserHeaders(req);
 
-			const groups = req.session.user.groups || [];
-			headers["X-User-Groups"] = JSON.stringify(groups);
-
-			headers["X-User-Name"] =
-				req.session.user.preferred_username ||
-				req.session.user.email ||
-				req.session.user.sub ||
-				"unknown";
-		}
+		FORWARD_REQUEST_HEADERS.forEach((h) => {
+			if (req.headers[h]) headers[h] = req.headers[h];
+		});
 
+		// Body diteruskan mentah (tanpa decompress/parse) supaya gzip & 304 dari backend tetap utuh
 		const response = await axios({
 			method,
 			url: `${PYTHON_API}${path}`,
+			params: req.query,
 			data: req.body,
 			headers: headers,
+			responseType: "arraybuffer",
+			decompress: false,
+			validateStatus: () => true,
 		});
-		res.status(response.status).json(response.data);
+
+		FORWARD_RESPONSE_HEADERS.forEach((h) => {
+			if (response.headers[h]) res.set(h, response.headers[h]);
+		});
+		res.status(response.status).send(Buffer.from(response.data));
 	} catch (e) {
-		// ... (error handling tetap sama)
-		if (e.response) {
-			res.status(e.response.status).json(e.response.data);
-		} else {
-			res.status(500).json({ error: "Gateway Error" });
-		}
+		res.status(500).json({ error: "Gateway Error" });
 	}
 };
 
+// Relay Server-Sent Events dari backend (stream dibiarkan terbuka, tanpa buffering)
+app.get("/api/stream", ensureAuthenticated, async (req, res) => {
+	const controller = new AbortController();
+	req.on("close", () => controller.abort());
+
+	try {
+		const headers = buildUserHeaders(req);
+		if (req.headers["last-event-id"])
+			headers["Last-Event-ID"] = req.headers["last-event-id"];
+
+		const response = await axios({
+			method: "get",
+			url: `${PYTHON_API}/api/stream`,
+			params: req.query,
+			headers: headers,
+			responseType: "stream",
+			signal: controller.signal,
+		});
+
+		res.status(response.status);
+		res.set({
+			"Content-Type": "text/event-stream",
+			"Cache-Control": "no-cache",
+			Connection: "keep-alive",
+			"X-Accel-Buffering": "no",
+		});
+		res.flushHeaders();
+
+		response.data.pipe(res);
+		response.data.on("error", () => res.end());
+	} catch (e) {
+		if (!res.headersSent) res.status(502).json({ error: "Gateway Error" });
+	}
+});
+
+// Export history di-stream apa adanya (sudah gzip dari backend), tanpa buffer di gateway
+app.get("/api/export", ensureAuthenticated, async (req, res) => {
+	const controller = new AbortController();
+	req.on("close", () => controller.abort());
+
+	try {
+		const response = await axios({
+			method: "get",
+			url: `${PYTHON_API}/api/export`,
+			params: req.query,
+			headers: buildUserHeaders(req),
+			responseType: "stream",
+			decompress: false,
+			validateStatus: () => true,
+			signal: controller.signal,
+		});
+
+		res.status(response.status);
+		for (const name of [
+			"content-type",
+			"content-disposition",
+			"cache-control",
+		]) {
+			if (response.headers[name]) res.set(name, response.headers[name]);
+		}
+		res.set("X-Accel-Buffering", "no");
+
+		response.data.pipe(res);
+		response.data.on("error", () => res.end());
+	} catch (e) {
+		if (!res.headersSent) res.status(502).json({ error: "Gateway Error" });
+	}
+});
+
 app.get("/api/me", ensureAuthenticated, preventCache, (req, res) =>
 	res.json(req.session.user),
 );
@@ -200,7 +294,24 @@ app.post("/api/alerts/clear", ensureAuthenticated, (req, res) =>
 	proxy("post", "/api/alerts/clear", req, res),
 );
 
-app.get("/api/status", ensureAuthenticated, preventCache, (req, res) =>
+app.get("/api/summary", ensureAuthenticated, preventCache, (req, res) =>
+	proxy("get", "/api/summary", req, res),
+);
+app.post("/api/heatmap", ensureAuthenticated, preventCache, (req, res) =>
+	proxy("post", "/api/heatmap", req, res),
+);
+app.get("/api/top", ensureAuthenticated, preventCache, (req, res) =>
+	proxy("get", "/api/top", req, res),
+);
+app.get("/api/map", ensureAuthenticated, preventCache, (req, res) =>
+	proxy("get", "/api/map", req, res),
+);
+app.get("/api/machines", ensureAuthenticated, preventCache, (req, res) =>
+	proxy("get", "/api/machines", req, res),
+);
+
+// Tanpa preventCache: browser boleh menyimpan dan revalidasi lewat ETag (304)
+app.get("/api/status", ensureAuthenticated, (req, res) =>
 	proxy("get", "/api/status", req, res),
 );
 
@@ -216,6 +327,9 @@ app.post("/api/hq", ensureAuthenticated, ensureAdmin, (req, res) =>
 app.post("/api/history", ensureAuthenticated, (req, res) =>
 	proxy("post", "/api/history", req, res),
 );
+app.post("/api/history/batch", ensureAuthenticated, (req, res) =>
+	proxy("post", "/api/history/batch", req, res),
+);
 app.get(
 	"/api/users",
 	ensureAuthenticated,
@@ -269,4 +383,26 @@ app.post(
 	(req, res) => proxy("post", "/api/admin/province-rules", req, res),
 );
 
+// Rule alert deklaratif (threshold latency/rx/tx/loss per node/provinsi)
+app.get(
+	"/api/admin/alert-rules",
+	ensureAuthenticated,
+	ensureAdmin,
+	preventCache,
+	(req, res) => proxy("get", "/api/admin/alert-rules", req, res),
+);
+app.post(
+	"/api/admin/alert-rules",
+	ensureAuthenticated,
+	ensureAdmin,
+	(req, res) => proxy("post", "/api/admin/alert-rules", req, res),
+);
+app.delete(
+	"/api/admin/alert-rules/:id",
+	ensureAuthenticated,
+	ensureAdmin,
+	(req, res) =>
+		proxy("delete", `/api/admin/alert-rules/${encodeURIComponent(req.params.id)}`, req, res),
+);
+
 app.listen(PORT, () => console.log(`Gateway running on port ${PORT}`));
@@ -0,0 +1,68 @@
+import json
+import threading
+from functools import lru_cache
+from database import get_db_connection
+
+# Cache scope akses (provinsi yang boleh dilihat) per kombinasi group user.
+# Di-invalidate saat province_rules diubah lewat /api/admin/province-rules.
+
+
+def parse_groups(header_value):
+    """Header X-User-Groups (JSON list) -> frozenset group yang dinormalisasi."""
+    try:
+        groups = json.loads(header_value or '[]')
+    except (TypeError, ValueError):
+        return frozenset()
+    if not isinstance(groups, list):
+        return frozenset()
+    return frozenset(str(g) for g in groups if g)
+
+
+class ScopeCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.scopes = {}
+        self.generation = 0
+
+    def provinces_for(self, groups):
+        """Provinsi yang diizinkan untuk set group (frozenset, dipakai bersama antar request)."""
+        with self.lock:
+            scope = self.scopes.get(groups)
+            generation = self.generation
+        if scope is not None:
+            return scope
+
+        scope = frozenset(self._load(groups))
+        with self.lock:
+            # Jangan simpan hasil yang dibaca sebelum rules berubah
+            if generation == self.generation:
+                self.scopes[groups] = scope
+        return scope
+
+    def _load(self, groups):
+        if not groups:
+            return []
+        conn = get_db_connection()
+        try:
+            rows = conn.execute("""
+                SELECT DISTINCT province FROM province_rules
+                WHERE group_pk IN (SELECT value FROM json_each(?))
+                   OR group_name IN (SELECT value FROM json_each(?))
+            """, (json.dumps(sorted(groups)),) * 2).fetchall()
+            return [r['province'] for r in rows]
+        finally:
+            conn.close()
+
+    def invalidate(self):
+        with self.lock:
+            self.scopes = {}
+            self.generation += 1
+
+
+@lru_cache(maxsize=256)
+def scope_json(provinces):
+    """Scope sebagai JSON list untuk parameter `IN (SELECT value FROM json_each(?))`."""
+    return json.dumps(sorted(provinces))
+
+
+scope_cache = ScopeCache()
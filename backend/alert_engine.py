@@ -0,0 +1,141 @@
+import time
+from collections import deque
+from datetime import datetime
+from config import Config
+from alerts import acquire_cooldown, enqueue_email_alert
+
+# Engine alert perubahan status node (dipanggil sekali per siklus monitor):
+# - flap detection: node yang berganti status >= ALERT_FLAP_THRESHOLD kali dalam
+#   ALERT_FLAP_WINDOW detik menghasilkan satu alert 'flap', lalu alert down-nya
+#   ditahan sampai node stabil lagi (hysteresis: <= setengah threshold)
+# - grouping: >= ALERT_GROUP_MIN node down bersamaan di satu provinsi dalam satu
+#   siklus digabung menjadi satu alert & satu email
+# - dedup/cooldown memakai tabel alert_cooldowns (lihat alerts.acquire_cooldown)
+#
+# Jendela flap di sini sengaja terpisah dari FleetStore.flaps (fleet.py): yang ini
+# menentukan alert (ALERT_FLAP_WINDOW, hysteresis, di-seed dari history setelah
+# restart, hanya di proses monitor), sedangkan fleet.py hanya ranking "paling
+# sering flap" 1 jam terakhir di tiap proses dan mulai kosong setelah restart.
+# Keduanya memakai definisi transisi yang sama (tanpa probe pertama node baru,
+# lihat NodeRecord.probed).
+
+# Jumlah id node yang ditulis di pesan alert gabungan
+GROUP_MESSAGE_IDS = 10
+
+
+class AlertEngine:
+    def __init__(self):
+        self.transitions = {}
+        self.flapping = set()
+        self.seeded = False
+
+    def seed(self, conn, now=None, until=None):
+        """Isi ulang jendela perubahan status dari history setelah restart agar node
+        yang sedang flapping tidak langsung menghasilkan alert down lagi.
+        until: timestamp siklus berjalan; history siklus ini (sudah di-insert pada
+        koneksi yang sama) tidak ikut dihitung karena dicatat lagi oleh evaluate."""
+        now = time.time() if now is None else now
+        since = datetime.fromtimestamp(now - Config.ALERT_FLAP_WINDOW).strftime("%Y-%m-%d %H:%M:%S")
+        until = until or datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+        rows = conn.execute("""
+            SELECT machine_id, time FROM (
+                SELECT machine_id, time, status,
+                       LAG(status) OVER (PARTITION BY machine_id ORDER BY id) AS prev_status
+                FROM history
+                WHERE time >= ? AND time < ?
+            )
+            WHERE prev_status IS NOT NULL AND prev_status != status
+        """, (since, until)).fetchall()
+
+        self.transitions = {}
+        for r in rows:
+            ts = datetime.strptime(r['time'], "%Y-%m-%d %H:%M:%S").timestamp()
+            self.transitions.setdefault(r['machine_id'], deque()).append(ts)
+        self.flapping = {
+            mid for mid, window in self.transitions.items()
+            if len(window) >= Config.ALERT_FLAP_THRESHOLD
+        }
+        self.seeded = True
+        if self.flapping:
+            print(f"[*] Alert engine: {len(self.flapping)} node masih flapping")
+
+    def _record(self, machine_id, now):
+        window = self.transitions.get(machine_id)
+        if window is None:
+            window = self.transitions[machine_id] = deque()
+        window.append(now)
+        self._prune(window, now)
+        return window
+
+    def _prune(self, window, now):
+        horizon = now - Config.ALERT_FLAP_WINDOW
+        while window and window[0] < horizon:
+            window.popleft()
+
+    def evaluate(self, conn, changes, timestamp, insert_alert, now=None):
+        """changes: list (node, is_online) untuk node yang statusnya berubah siklus ini.
+        insert_alert(conn, node, type, message, timestamp) menulis ke app_alerts.
+        Mengembalikan alert baru (untuk dipublish setelah commit)."""
+        now = time.time() if now is None else now
+        if not self.seeded:
+            self.seed(conn, now, until=timestamp)
+
+        new_alerts = []
+        down_nodes = []
+        for node, is_online in changes:
+            window = self._record(node.id, now)
+            if node.id in self.flapping:
+                continue
+
+            if len(window) >= Config.ALERT_FLAP_THRESHOLD:
+                self.flapping.add(node.id)
+                if node.notify_down and acquire_cooldown(conn, node.id, 'flap', now=now):
+                    msg = f"Node flapping: {len(window)} perubahan status dalam {Config.ALERT_FLAP_WINDOW // 60} menit. Alert down ditahan sampai stabil."
+                    new_alerts.append(insert_alert(conn, node, 'flap', msg, timestamp))
+                    if node.notify_email:
+                        enqueue_email_alert(conn, node, 'flap', msg, cooldown=False)
+                continue
+
+            if not is_online and node.notify_down:
+                down_nodes.append(node)
+
+        self._release_stable(now)
+        new_alerts.extend(self._down_alerts(conn, down_nodes, timestamp, insert_alert))
+        return new_alerts
+
+    def _release_stable(self, now):
+        for mid in list(self.flapping):
+            window = self.transitions.get(mid)
+            if window is not None:
+                self._prune(window, now)
+            if not window or len(window) <= Config.ALERT_FLAP_THRESHOLD // 2:
+                self.flapping.discard(mid)
+                print(f"[*] Alert engine: {mid} stabil kembali")
+
+    def _down_alerts(self, conn, nodes, timestamp, insert_alert):
+        by_province = {}
+        for node in nodes:
+            by_province.setdefault(node.province or '', []).append(node)
+
+        new_alerts = []
+        for province, group in by_province.items():
+            if len(group) < Config.ALERT_GROUP_MIN:
+                for node in group:
+                    msg = "Node unreachable. Ping Timeout."
+                    new_alerts.append(insert_alert(conn, node, 'down', msg, timestamp))
+                    if node.notify_email:
+                        enqueue_email_alert(conn, node, 'down', msg)
+                continue
+
+            # Banyak node down bersamaan: kemungkinan gangguan uplink/area, satu alert saja
+            ids = ", ".join(n.id for n in group[:GROUP_MESSAGE_IDS])
+            if len(group) > GROUP_MESSAGE_IDS:
+                ids += f", +{len(group) - GROUP_MESSAGE_IDS} lainnya"
+            msg = f"{len(group)} node unreachable bersamaan di {province or 'provinsi tidak diketahui'}: {ids}"
+            new_alerts.append(insert_alert(conn, group[0], 'down', msg, timestamp))
+            if any(n.notify_email for n in group):
+                enqueue_email_alert(conn, group[0], 'down', msg, cooldown=False)
+        return new_alerts
+
+
+engine = AlertEngine()
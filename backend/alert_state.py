@@ -0,0 +1,177 @@
+import json
+
+# Status baca/hapus alert per user dengan model watermark:
+# - alert_watermarks : satu baris per user, read_upto & cleared_upto = id alert
+#                      tertinggi yang sudah dibaca / dihapus (semua alert <= id)
+# - alert_status     : pengecualian per alert di atas watermark (baca/hapus satu alert)
+# Mark-all-read/clear cukup menggeser watermark dan membuang pengecualian
+# yang sudah tercakup, sehingga tabel tidak tumbuh alerts x users.
+# Badge unread = alert_totals - alert_seen, keduanya per provinsi:
+# - alert_totals     : jumlah alert per provinsi (+1 per insert, satu baris)
+# - alert_seen       : per user & provinsi, jumlah alert yang sudah dibaca (<= watermark
+#                      atau punya pengecualian). Hanya diubah di jalur tulis (mark
+#                      read/clear, purge, node dihapus/pindah provinsi), sehingga
+#                      GET /api/alerts hanya membaca. User tanpa baris = belum membaca apa pun.
+
+# Alert yang dihitung: alert dengan machine yang masih ada (sama seperti daftar alert)
+PROVINCE_SQL = "COALESCE(m.province, '')"
+
+
+def get_watermarks(conn, username):
+    row = conn.execute(
+        "SELECT read_upto, cleared_upto FROM alert_watermarks WHERE username = ?",
+        (username,)).fetchone()
+    if row is None:
+        return 0, 0
+    return row['read_upto'], row['cleared_upto']
+
+
+def count_new_alert(conn, province):
+    """Dipanggil saat alert di-insert (transaksi yang sama)."""
+    conn.execute("""
+        INSERT INTO alert_totals (province, total) VALUES (?, 1)
+        ON CONFLICT(province) DO UPDATE SET total = total + 1
+    """, (province or '',))
+
+
+def adjust_counters(conn, where_sql, params, sign):
+    """Keluarkan (sign=-1) atau masukkan (sign=1) sekumpulan alert (kondisi where_sql
+    atas alias a, dengan provinsi machine saat ini) dari counter total & seen semua user.
+    Dipakai sebelum purge / hapus node dan sebelum & sesudah node pindah provinsi."""
+    conn.execute(f"""
+        INSERT INTO alert_totals (province, total)
+        SELECT {PROVINCE_SQL}, ? * COUNT(*)
+        FROM app_alerts a
+        JOIN machines m ON a.machine_id = m.id
+        WHERE {where_sql}
+        GROUP BY {PROVINCE_SQL}
+        ON CONFLICT(province) DO UPDATE SET total = total + excluded.total
+    """, [sign] + list(params))
+    # Hanya alert yang sudah dibaca user (<= watermark atau pengecualian) yang mengubah seen
+    conn.execute(f"""
+        INSERT INTO alert_seen (username, province, seen)
+        SELECT u.username, {PROVINCE_SQL}, ? * COUNT(*)
+        FROM (SELECT username FROM alert_watermarks UNION SELECT username FROM alert_seen) u
+        LEFT JOIN alert_watermarks w ON w.username = u.username
+        JOIN app_alerts a ON {where_sql}
+        JOIN machines m ON a.machine_id = m.id
+        WHERE a.id <= COALESCE(w.read_upto, 0)
+           OR EXISTS (SELECT 1 FROM alert_status s WHERE s.alert_id = a.id AND s.username = u.username)
+        GROUP BY u.username, {PROVINCE_SQL}
+        ON CONFLICT(username, province) DO UPDATE SET seen = seen + excluded.seen
+    """, [sign] + list(params))
+
+
+def resync_user(conn, username):
+    """seen user = total - alert unread (di atas watermark tanpa pengecualian, range kecil)."""
+    read_upto, _ = get_watermarks(conn, username)
+    conn.execute("DELETE FROM alert_seen WHERE username = ?", (username,))
+    conn.execute(f"""
+        INSERT INTO alert_seen (username, province, seen)
+        SELECT ?, t.province, t.total - COALESCE(u.unread, 0)
+        FROM alert_totals t
+        LEFT JOIN (
+            SELECT {PROVINCE_SQL} AS province, COUNT(*) AS unread
+            FROM app_alerts a
+            JOIN machines m ON a.machine_id = m.id
+            WHERE a.id > ?
+              AND NOT EXISTS (SELECT 1 FROM alert_status s WHERE s.alert_id = a.id AND s.username = ?)
+            GROUP BY {PROVINCE_SQL}
+        ) u ON u.province = t.province
+    """, (username, read_upto, username))
+
+
+def rebuild_counters(conn):
+    """Hitung ulang semua counter dari app_alerts (migrasi, dipanggil init_db)."""
+    conn.execute("DELETE FROM alert_totals")
+    conn.execute(f"""
+        INSERT INTO alert_totals (province, total)
+        SELECT {PROVINCE_SQL}, COUNT(*)
+        FROM app_alerts a
+        JOIN machines m ON a.machine_id = m.id
+        GROUP BY {PROVINCE_SQL}
+    """)
+    conn.execute("DELETE FROM alert_seen")
+    users = conn.execute(
+        "SELECT username FROM alert_watermarks UNION SELECT username FROM alert_status").fetchall()
+    for r in users:
+        resync_user(conn, r[0])
+
+
+def unread_count(conn, username, provinces=None, scope_param=None):
+    """Badge unread: total - seen per provinsi dalam scope user. Hanya membaca
+    (O(jumlah provinsi)), tidak ada COUNT atas app_alerts."""
+    province_filter_sql = "AND province IN (SELECT value FROM json_each(?))" if provinces is not None else ""
+    scope = [scope_param] if provinces is not None else []
+    row = conn.execute(f"""
+        SELECT (SELECT COALESCE(SUM(total), 0) FROM alert_totals WHERE 1 {province_filter_sql})
+             - (SELECT COALESCE(SUM(seen), 0) FROM alert_seen WHERE username = ? {province_filter_sql})
+    """, scope + [username] + scope).fetchone()
+    return max(0, row[0])
+
+
+def latest_alert_id(conn):
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM app_alerts").fetchone()[0]
+
+
+def _raise_watermark(conn, username, read_upto, cleared_upto=0):
+    conn.execute("""
+        INSERT INTO alert_watermarks (username, read_upto, cleared_upto)
+        VALUES (?, ?, ?)
+        ON CONFLICT(username) DO UPDATE SET
+            read_upto = MAX(read_upto, excluded.read_upto),
+            cleared_upto = MAX(cleared_upto, excluded.cleared_upto),
+            updated_at = CURRENT_TIMESTAMP
+    """, (username, read_upto, cleared_upto))
+
+
+def mark_all_read(conn, username, upto=None):
+    """Semua alert sampai `upto` (default alert terbaru) dianggap sudah dibaca."""
+    upto = latest_alert_id(conn) if upto is None else upto
+    _raise_watermark(conn, username, upto)
+    # Pengecualian 'read' di bawah watermark tidak diperlukan lagi
+    conn.execute("""
+        DELETE FROM alert_status
+        WHERE username = ? AND alert_id <= ? AND is_cleared = 0
+    """, (username, upto))
+    resync_user(conn, username)
+    return upto
+
+
+def mark_all_cleared(conn, username, upto=None):
+    """Semua alert sampai `upto` dihapus dari daftar user (sekaligus dianggap dibaca)."""
+    upto = latest_alert_id(conn) if upto is None else upto
+    _raise_watermark(conn, username, upto, upto)
+    conn.execute("DELETE FROM alert_status WHERE username = ? AND alert_id <= ?", (username, upto))
+    resync_user(conn, username)
+    return upto
+
+
+def mark_ids(conn, username, alert_ids, cleared=False):
+    """Tandai alert tertentu (baca atau hapus) sebagai pengecualian, satu statement.
+    Alert yang sudah tercakup watermark dilewati."""
+    read_upto, cleared_upto = get_watermarks(conn, username)
+    floor = cleared_upto if cleared else read_upto
+    ids_json = json.dumps([int(i) for i in alert_ids])
+    # seen bertambah untuk alert yang sebelumnya belum dibaca (di atas read_upto,
+    # belum punya pengecualian), dihitung sebelum pengecualiannya ditulis
+    conn.execute(f"""
+        INSERT INTO alert_seen (username, province, seen)
+        SELECT ?, {PROVINCE_SQL}, COUNT(*)
+        FROM app_alerts a
+        JOIN machines m ON a.machine_id = m.id
+        WHERE a.id IN (SELECT value FROM json_each(?)) AND a.id > ?
+          AND NOT EXISTS (SELECT 1 FROM alert_status s WHERE s.alert_id = a.id AND s.username = ?)
+        GROUP BY {PROVINCE_SQL}
+        ON CONFLICT(username, province) DO UPDATE SET seen = seen + excluded.seen
+    """, (username, ids_json, read_upto, username))
+    conn.execute("""
+        INSERT INTO alert_status (alert_id, username, is_read, is_cleared)
+        SELECT a.id, ?, 1, ?
+        FROM app_alerts a
+        WHERE a.id IN (SELECT value FROM json_each(?)) AND a.id > ?
+        ON CONFLICT(alert_id, username) DO UPDATE SET
+            is_read = 1,
+            is_cleared = MAX(is_cleared, excluded.is_cleared),
+            updated_at = CURRENT_TIMESTAMP
+    """, (username, 1 if cleared else 0, ids_json, floor))
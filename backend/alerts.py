@@ -3,79 +3,214 @@ import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from config import Config
+from database import get_db_connection
 
-# Cache sederhana untuk Cooldown di memori
-cooldown_cache = {}
+# Email alert tidak lagi dikirim langsung dari monitor loop: alert dimasukkan
+# ke tabel email_outbox (ikut transaksi siklus monitor) lalu dikirim oleh
+# dispatcher di background. Alert dalam satu window digabung menjadi digest
+# per recipient/provinsi dan dikirim lewat satu sesi SMTP yang dipakai ulang.
 
-def check_cooldown(machine_id, alert_type):
-    key = f"{machine_id}_{alert_type}"
-    last_time = cooldown_cache.get(key, 0)
-    now = time.time()
-    return (now - last_time) > Config.ALERT_COOLDOWN
+# Sesi SMTP ditutup jika tidak dipakai selama ini (server biasanya memutus ~5 menit)
+SMTP_IDLE_CLOSE = 240
+# Email terkirim/gagal disimpan sebentar di outbox untuk audit, lalu dibuang
+OUTBOX_KEEP_SENT = 7 * 86400
 
-def update_cooldown(machine_id, alert_type):
-    key = f"{machine_id}_{alert_type}"
-    cooldown_cache[key] = time.time()
+def acquire_cooldown(conn, machine_id, alert_type, cooldown=None, now=None):
+    """Cek & set cooldown persisten (tabel alert_cooldowns) dalam satu statement.
+    True jika alert boleh dikirim. Tetap berlaku setelah restart dan aman dipakai
+    bersama oleh beberapa proses; ikut transaksi koneksi pemanggil."""
+    cooldown = Config.ALERT_COOLDOWN if cooldown is None else cooldown
+    now = time.time() if now is None else now
+    cur = conn.execute("""
+        INSERT INTO alert_cooldowns (machine_id, alert_type, last_fired) VALUES (?, ?, ?)
+        ON CONFLICT(machine_id, alert_type) DO UPDATE SET last_fired = excluded.last_fired
+        WHERE alert_cooldowns.last_fired <= ?
+    """, (machine_id, alert_type, now, now - cooldown))
+    return cur.rowcount > 0
 
-def send_email_alert(machine_id, alert_type, message):
+def enqueue_email_alert(conn, node, alert_type, message, cooldown=True):
+    """Masukkan email alert ke outbox pada koneksi/transaksi pemanggil (di-commit
+    bersama siklus monitor). Cooldown per node & tipe berlaku kecuali cooldown=False."""
     if not Config.SMTP_SERVER or not Config.ALERT_RECIPIENT:
         print("[!] Email Config Missing")
         return False
 
-    if not check_cooldown(machine_id, alert_type):
+    now = time.time()
+    if cooldown and not acquire_cooldown(conn, node.id, alert_type, now=now):
         return False
 
-    # Siapkan Email
-    msg = MIMEMultipart()
-    msg['From'] = Config.SMTP_EMAIL or "monitorr@localhost"
-    msg['To'] = Config.ALERT_RECIPIENT
-    msg['Subject'] = f"[Monitorr] Alert: {machine_id} is {alert_type.upper()}"
+    conn.execute("""
+        INSERT INTO email_outbox (machine_id, province, alert_type, message, recipient, created_at, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (node.id, node.province or '', alert_type, message, Config.ALERT_RECIPIENT, now, now))
+    return True
 
-    body = f"""
-    Sistem Monitoring mendeteksi masalah:
-    
-    Node ID   : {machine_id}
-    Status    : {alert_type.upper()}
-    Pesan     : {message}
-    Waktu     : {time.ctime()}
-    
-    Cek dashboard untuk detail.
-    """
-    msg.attach(MIMEText(body, 'plain'))
 
-    server = None
-    try:
-        # Inisialisasi Koneksi (Tanpa Timeout di Constructor untuk stabilitas)
+class SmtpSession:
+    """Satu koneksi SMTP yang dipakai ulang antar digest, dibuka ulang jika putus."""
+
+    def __init__(self):
+        self.server = None
+        self.last_used = 0
+
+    def _connect(self):
         server = smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT, timeout=10)
         server.ehlo()
 
         # [SKIP TLS] Sesuai konfigurasi yang bekerja
         # server.starttls()
-        
+
         # Login dengan Fallback (Graceful)
         if Config.SMTP_EMAIL and Config.SMTP_PASSWORD:
             try:
                 server.login(Config.SMTP_EMAIL, Config.SMTP_PASSWORD)
             except smtplib.SMTPNotSupportedError:
                 pass # Server tidak support auth, lanjut kirim (relay)
-            except Exception as e:
-                print(f"[!] SMTP Login Failed: {e}")
-                return False
-
-        # Kirim
-        server.sendmail(msg['From'], msg['To'], msg.as_string())
-        print(f"[*] Email sent to {Config.ALERT_RECIPIENT} ({machine_id}: {alert_type})")
-        
-        update_cooldown(machine_id, alert_type)
-        return True
-
-    except Exception as e:
-        print(f"[!] Email Send Error: {e}")
-        return False
-        
-    finally:
-        if server:
+            except Exception:
+                server.close()
+                raise
+        return server
+
+    def send(self, msg):
+        recipients = [r.strip() for r in msg['To'].split(',') if r.strip()]
+        for attempt in range(2):
+            if self.server is None:
+                self.server = self._connect()
+            try:
+                self.server.sendmail(msg['From'], recipients, msg.as_string())
+                self.last_used = time.time()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                # Koneksi lama diputus server: buka ulang sekali
+                self.close()
+                if attempt:
+                    raise
+
+    def close_if_idle(self):
+        if self.server is not None and time.time() - self.last_used > SMTP_IDLE_CLOSE:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
             try:
-                server.quit()
-            except:
+                self.server.quit()
+            except Exception:
                 pass
+            self.server = None
+
+
+def digest_key(row):
+    if Config.EMAIL_DIGEST_GROUP == 'recipient':
+        return (row['recipient'], None)
+    return (row['recipient'], row['province'])
+
+def build_message(recipient, province, rows):
+    msg = MIMEMultipart()
+    msg['From'] = Config.SMTP_EMAIL or "monitorr@localhost"
+    msg['To'] = recipient
+
+    if len(rows) == 1:
+        r = rows[0]
+        msg['Subject'] = f"[Monitorr] Alert: {r['machine_id']} is {r['alert_type'].upper()}"
+        body = f"""
+    Sistem Monitoring mendeteksi masalah:
+
+    Node ID   : {r['machine_id']}
+    Status    : {r['alert_type'].upper()}
+    Pesan     : {r['message']}
+    Waktu     : {time.ctime(r['created_at'])}
+
+    Cek dashboard untuk detail.
+    """
+    else:
+        scope = f" ({province})" if province else ""
+        msg['Subject'] = f"[Monitorr] Digest: {len(rows)} alert{scope}"
+        lines = "\n".join(
+            f"    [{time.strftime('%H:%M:%S', time.localtime(r['created_at']))}] "
+            f"{r['machine_id']} {r['alert_type'].upper()}: {r['message']}"
+            for r in rows)
+        body = f"""
+    Sistem Monitoring mendeteksi {len(rows)} masalah{scope}:
+
+{lines}
+
+    Cek dashboard untuk detail.
+    """
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+class EmailDispatcher:
+    def __init__(self):
+        self.session = SmtpSession()
+
+    def dispatch_once(self):
+        """Kirim semua email yang jatuh tempo sebagai digest. Digest yang gagal
+        dijadwalkan ulang dengan backoff eksponensial sampai EMAIL_MAX_ATTEMPTS."""
+        now = time.time()
+        conn = get_db_connection()
+        try:
+            rows = conn.execute("""
+                SELECT * FROM email_outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY id
+            """, (now,)).fetchall()
+
+            groups = {}
+            for r in rows:
+                groups.setdefault(digest_key(r), []).append(r)
+
+            sent = 0
+            for (recipient, province), items in groups.items():
+                ids = [(r['id'],) for r in items]
+                try:
+                    self.session.send(build_message(recipient, province, items))
+                except Exception as e:
+                    self.session.close()
+                    self._reschedule(conn, items, str(e), now)
+                    print(f"[!] Email Send Error ({len(items)} alert ke {recipient}): {e}")
+                else:
+                    conn.executemany(
+                        "UPDATE email_outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        [(now,) + i for i in ids])
+                    sent += len(items)
+                # Status per digest langsung disimpan agar tidak terkirim ganda setelah restart
+                conn.commit()
+
+            conn.execute("DELETE FROM email_outbox WHERE status != 'pending' AND created_at < ?",
+                         (now - OUTBOX_KEEP_SENT,))
+            conn.commit()
+        finally:
+            conn.close()
+
+        if sent:
+            print(f"[*] Email sent: {sent} alert dalam {len(groups)} email")
+        self.session.close_if_idle()
+        return sent
+
+    def _reschedule(self, conn, items, error, now):
+        updates = []
+        for r in items:
+            attempts = r['attempts'] + 1
+            delay = min(Config.EMAIL_RETRY_BASE * (2 ** (attempts - 1)), Config.EMAIL_RETRY_MAX)
+            status = 'failed' if attempts >= Config.EMAIL_MAX_ATTEMPTS else 'pending'
+            updates.append((status, attempts, now + delay, error[:500], r['id']))
+        conn.executemany("""
+            UPDATE email_outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+            WHERE id = ?
+        """, updates)
+
+    def run(self):
+        print(f"[*] Email Dispatcher Started (digest window {Config.EMAIL_DIGEST_WINDOW}s)")
+        while True:
+            try:
+                self.dispatch_once()
+            except Exception as e:
+                print(f"[!] Email Dispatcher Error: {e}")
+            time.sleep(Config.EMAIL_DIGEST_WINDOW)
+
+
+dispatcher = EmailDispatcher()
+
+def dispatcher_loop():
+    dispatcher.run()
@@ -1,16 +1,40 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from config import Config
-from database import init_db, get_db_connection
+from database import init_db, get_db_connection, log_change
 from monitoring import monitor_loop
+from fleet import store, RANK_METRICS
+from settings import settings
+from alert_state import get_watermarks, unread_count, mark_all_read, mark_all_cleared, mark_ids, adjust_counters
+from access import scope_cache, parse_groups, scope_json
+from status_cache import status_cache, scope_key_for
+from events import hub
+from downsample import downsample_history, CHART_METRICS, DEFAULT_METRICS
+from geo import viewport_clusters
+from inventory import query_machines, QueryError, DEFAULT_PAGE_SIZE
+from rules import validate_rule, list_rules, RuleError
+from history import resolve_range, bucketed_history, iter_history_chunks, heatmap_matrix, HEATMAP_METRICS, EXPORT_COLUMNS
+from wire import negotiate_format, history_payload, status_payload, COLUMNAR_JSON_MIME, COLUMNAR_BINARY_MIME
 from oidc_service import authenticate_oidc
+from snapshot import restore_snapshot, save_snapshot, snapshot_loop
+from follower import follower
+from retention import retention_loop
+from alerts import dispatcher_loop
 import threading
 import time
+import queue
 import sqlite3
 import requests
 import json
 import os
 import re
+import sys
+import atexit
+import csv
+import io
+import zlib
+import signal
 import ipaddress
+from datetime import datetime, timedelta
 
 app = Flask(__name__)
 
@@ -18,6 +42,10 @@ PROM_TARGETS_FILE = "/app/prom_targets/snmp_targets.json"
 MANAGER_API_URL = "http://app-manager:5001/api/groups"
 SNMP_EXPORTER_URL = "http://snmp-exporter:9116"
 
+# Interval komentar keep-alive di stream SSE (detik)
+STREAM_KEEPALIVE = 15
+
+# HQ default selama belum ada hasil deteksi / setting manual
 HQ_INFO = {
     "lat": None,
     "lng": None,
@@ -48,8 +76,10 @@ def probe_snmp(machine_id, host):
             
             conn = get_db_connection()
             conn.execute("UPDATE machines SET use_snmp = 1 WHERE id = ?", (machine_id,))
+            log_change(conn, 'upsert', machine_id)
             conn.commit()
             conn.close()
+            follower.poll()
             
             sync_prometheus_targets()
         else:
@@ -105,99 +135,117 @@ def is_valid_host_or_ip(target):
         
     return False
 
+HQ_SETTING_KEYS = ('hq_manual', 'hq_lat', 'hq_lng', 'hq_city', 'hq_region', 'hq_country')
+
+def manual_hq_info():
+    s = settings.snapshot(HQ_SETTING_KEYS)
+    return {
+        "lat": s['hq_lat'],
+        "lng": s['hq_lng'],
+        "city": s['hq_city'],
+        "region": s['hq_region'],
+        "country": s['hq_country'],
+        "ip": "Manual Override",
+        "org": "Internal",
+        "is_manual": True
+    }
+
+def detected_hq():
+    """HQ hasil auto-detect terakhir (disimpan proses monitor di settings), atau None."""
+    raw = settings.get('hq_detected')
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+def current_hq():
+    if settings.get('hq_manual'):
+        return manual_hq_info()
+    info = detected_hq()
+    if info is None:
+        return HQ_INFO
+    return {k: v for k, v in info.items() if k != 'detected_at'}
+
 def init_hq_location():
-    global HQ_INFO
+    """Deteksi HQ via ipinfo.io. Hanya berjalan di proses background; hasilnya
+    disimpan ke settings sehingga semua worker API membacanya."""
     try:
-        # Cek apakah mode manual aktif di database
-        is_manual = get_setting('hq_manual', '0')
+        # Cek apakah mode manual aktif (registry settings)
+        if settings.get('hq_manual'):
+            print("[*] Using Manual HQ Location from Settings.")
+            return
+
+        # Pakai hasil deteksi sebelumnya jika masih segar
+        cached = detected_hq()
+        if cached and (time.time() - cached.get('detected_at', 0)) <= Config.HQ_CACHE_TTL:
+            print(f"[*] HQ Location restored from settings: {cached.get('city')}")
+            return
+
+        # Jika tidak manual, jalankan deteksi IP seperti biasa
+        print("[*] Auto-detecting HQ Location via ipinfo.io...")
+        resp = requests.get('https://ipinfo.io/json', timeout=10)
         
-        if is_manual == '1':
-            print("[*] Loading Manual HQ Location from Database...")
-            HQ_INFO = {
-                "lat": float(get_setting('hq_lat', 0)),
-                "lng": float(get_setting('hq_lng', 0)),
-                "city": get_setting('hq_city', 'Manual Location'),
-                "region": get_setting('hq_region', ''),
-                "country": get_setting('hq_country', ''),
-                "ip": "Manual Override",
-                "org": "Internal",
-                "is_manual": True
+        if resp.status_code == 200:
+            data = resp.json()
+            loc_str = data.get('loc', '')
+            lat, lng = 0, 0
+            if ',' in loc_str:
+                try:
+                    parts = loc_str.split(',')
+                    lat = float(parts[0])
+                    lng = float(parts[1])
+                except ValueError:
+                    pass
+
+            info = {
+                "lat": lat,
+                "lng": lng,
+                "city": data.get('city', 'Unknown'),
+                "region": data.get('region', ''),
+                "country": data.get('country', ''),
+                "ip": data.get('ip', 'Unknown'),
+                "org": data.get('org', ''),
+                "is_manual": False,
+                "detected_at": time.time()
             }
+            settings.update({'hq_detected': json.dumps(info)})
+            print(f"[*] HQ Location Detected: {info['city']}")
         else:
-            # Jika tidak manual, jalankan deteksi IP seperti biasa
-            print("[*] Auto-detecting HQ Location via ipinfo.io...")
-            resp = requests.get('https://ipinfo.io/json', timeout=10)
-            
-            if resp.status_code == 200:
-                data = resp.json()
-                loc_str = data.get('loc', '')
-                lat, lng = 0, 0
-                if ',' in loc_str:
-                    try:
-                        parts = loc_str.split(',')
-                        lat = float(parts[0])
-                        lng = float(parts[1])
-                    except ValueError:
-                        pass
-
-                HQ_INFO = {
-                    "lat": lat,
-                    "lng": lng,
-                    "city": data.get('city', 'Unknown'),
-                    "region": data.get('region', ''),
-                    "country": data.get('country', ''),
-                    "ip": data.get('ip', 'Unknown'),
-                    "org": data.get('org', ''),
-                    "is_manual": False
-                }
-                print(f"[*] HQ Location Detected: {HQ_INFO['city']}")
-            else:
-                print(f"[!] Failed to detect location: {resp.status_code}")
+            print(f"[!] Failed to detect location: {resp.status_code}")
             
     except Exception as e:
         print(f"[!] HQ Init Error: {e}")
 
-threading.Thread(target=init_hq_location, daemon=True).start()
+def on_hq_settings_changed(changed):
+    """Subscriber settings di proses background: kembali ke mode auto (hasil deteksi
+    dikosongkan oleh POST /api/hq) memicu deteksi ulang."""
+    if not settings.get('hq_manual') and not settings.get('hq_detected'):
+        threading.Thread(target=init_hq_location, daemon=True).start()
 
 @app.route('/api/hq', methods=['POST'])
 def update_hq_location():
-    global HQ_INFO
     data = request.json
     
     try:
         mode = data.get('mode') # 'auto' atau 'manual'
         
         if mode == 'auto':
-            # Set setting ke auto dan reload
-            set_setting('hq_manual', '0')
-            # Panggil fungsi init ulang di thread terpisah atau langsung
-            threading.Thread(target=init_hq_location, daemon=True).start()
+            # Hasil deteksi lama dikosongkan: proses background mendeteksi ulang
+            settings.update({'hq_manual': False, 'hq_detected': ''})
             return jsonify({"success": True, "message": "Reverting to auto detection..."})
             
         elif mode == 'manual':
-            lat = float(data.get('lat'))
-            lng = float(data.get('lng'))
-            city = data.get('city', 'Manual Location')
-            
-            # Simpan ke Database (Settings)
-            set_setting('hq_manual', '1')
-            set_setting('hq_lat', lat)
-            set_setting('hq_lng', lng)
-            set_setting('hq_city', city)
-            set_setting('hq_region', data.get('region', ''))
-            set_setting('hq_country', data.get('country', ''))
-            
-            # Update Memory Global Langsung (agar tidak perlu restart)
-            HQ_INFO = {
-                "lat": lat,
-                "lng": lng,
-                "city": city,
-                "region": data.get('region', ''),
-                "country": data.get('country', ''),
-                "ip": "Manual Override",
-                "org": "Internal",
-                "is_manual": True
-            }
+            # Simpan ke settings; GET /api/hq langsung membaca nilai manual
+            settings.update({
+                'hq_manual': True,
+                'hq_lat': float(data.get('lat')),
+                'hq_lng': float(data.get('lng')),
+                'hq_city': data.get('city', 'Manual Location'),
+                'hq_region': data.get('region', ''),
+                'hq_country': data.get('country', '')
+            })
             
             return jsonify({"success": True, "message": "HQ Location updated manually"})
             
@@ -209,52 +257,20 @@ def update_hq_location():
 
 @app.route('/api/hq', methods=['GET'])
 def get_hq_info():
-    return jsonify(HQ_INFO)
-
-def get_setting(key, default_val):
-    conn = get_db_connection()
-    row = conn.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
-    conn.close()
-    return row['value'] if row else default_val
-
-def set_setting(key, value):
-    conn = get_db_connection()
-    conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
-    conn.commit()
-    conn.close()
-
-def get_allowed_provinces(conn, user_groups):
-    if not user_groups:
-        return []
-    
-    placeholders = ','.join(['?'] * len(user_groups))
-    query = f"""
-        SELECT DISTINCT province 
-        FROM province_rules 
-        WHERE group_pk IN ({placeholders}) 
-           OR group_name IN ({placeholders})
-    """
-    params = user_groups + user_groups
-    rows = conn.execute(query, params).fetchall()
-    return [r['province'] for r in rows]
+    return jsonify(current_hq())
 
 @app.route('/api/settings', methods=['GET'])
 def get_settings():
-    lat_thresh = int(get_setting('latency_threshold', 100))
-    bw_thresh = int(get_setting('bandwidth_threshold', 10000))
-    return jsonify({
-        "latency_threshold": lat_thresh,
-        "bandwidth_threshold": bw_thresh
-    })
+    return jsonify(settings.snapshot(('latency_threshold', 'bandwidth_threshold')))
 
 @app.route('/api/settings', methods=['POST'])
 def update_settings():
     data = request.json
     try:
-        if 'latency_threshold' in data:
-            set_setting('latency_threshold', int(data['latency_threshold']))
-        if 'bandwidth_threshold' in data:
-            set_setting('bandwidth_threshold', int(data['bandwidth_threshold']))
+        settings.update({
+            key: int(data[key])
+            for key in ('latency_threshold', 'bandwidth_threshold') if key in data
+        })
         return jsonify({"success": True, "message": "Settings updated"})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -296,13 +312,8 @@ def get_authentik_groups():
 
 @app.route('/api/admin/provinces', methods=['GET'])
 def get_available_provinces():
-    conn = get_db_connection()
-    try:
-        rows = conn.execute("SELECT DISTINCT province FROM machines WHERE province IS NOT NULL AND province != '' ORDER BY province ASC").fetchall()
-        provinces = [row['province'] for row in rows]
-        return jsonify(provinces)
-    finally:
-        conn.close()
+    store.ensure_loaded()
+    return jsonify(store.provinces())
 
 @app.route('/api/admin/province-rules', methods=['GET', 'POST'])
 def manage_province_rules():
@@ -338,7 +349,9 @@ def manage_province_rules():
                     (group_pk, group_name, prov)
                 )
             
+            log_change(conn, 'scope')
             conn.commit()
+            scope_cache.invalidate()
             return jsonify({"success": True, "message": "Rules updated"})
 
     except Exception as e:
@@ -347,6 +360,53 @@ def manage_province_rules():
     finally:
         conn.close()
 
+@app.route('/api/admin/alert-rules', methods=['GET', 'POST'])
+def manage_alert_rules():
+    """Rule alert deklaratif. POST dengan "id" mengubah rule yang ada.
+    Monitor mengkompilasi ulang rule pada siklus berikutnya."""
+    if request.method == 'GET':
+        return jsonify(list_rules())
+
+    data = request.json or {}
+    try:
+        rule = validate_rule(data)
+    except RuleError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db_connection()
+    try:
+        columns = ('name', 'metric', 'op', 'threshold', 'consecutive', 'scope', 'scope_value', 'enabled')
+        values = [rule[c] for c in columns]
+        if data.get('id'):
+            cur = conn.execute(f"""
+                UPDATE alert_rules SET {', '.join(f'{c} = ?' for c in columns)}, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, values + [data['id']])
+            if cur.rowcount == 0:
+                return jsonify({"error": "Rule not found"}), 404
+            rule_id = data['id']
+        else:
+            cur = conn.execute(
+                f"INSERT INTO alert_rules ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                values)
+            rule_id = cur.lastrowid
+        conn.commit()
+        return jsonify({"success": True, "id": rule_id})
+    finally:
+        conn.close()
+
+@app.route('/api/admin/alert-rules/<int:rule_id>', methods=['DELETE'])
+def delete_alert_rule(rule_id):
+    conn = get_db_connection()
+    try:
+        cur = conn.execute("DELETE FROM alert_rules WHERE id = ?", (rule_id,))
+        if cur.rowcount == 0:
+            return jsonify({"error": "Rule not found"}), 404
+        conn.commit()
+        return jsonify({"success": True})
+    finally:
+        conn.close()
+
 @app.route('/login', methods=['POST'])      
 @app.route('/api/auth/login', methods=['POST'])
 def login():
@@ -360,155 +420,87 @@ def login():
     else:
         return jsonify({"success": False, "message": "Authentication failed"}), 401
 
+ALERTS_PAGE_SIZE = 20
+ALERTS_MAX_PAGE_SIZE = 100
+
 @app.route('/api/alerts', methods=['GET'])
 def get_alerts():
     # 1. Ambil Context User
     current_user = request.headers.get('X-User-Name')
-    user_role = request.headers.get('X-User-Role', 'user')
-    user_groups_str = request.headers.get('X-User-Groups', '[]')
     
     if not current_user:
         return jsonify({"alerts": [], "unread_count": 0})
 
-    try:
-        user_groups = json.loads(user_groups_str)
-    except:
-        user_groups = []
-
-    conn = get_db_connection()
-    
     province_filter_sql = ""
     province_params = []
     
-    if user_role != 'admin':
-        allowed = get_allowed_provinces(conn, user_groups)
+    allowed = resolve_status_provinces()
+    if allowed is not None:
         if not allowed:
-            conn.close()
             return jsonify({"alerts": [], "unread_count": 0})
         
-        placeholders = ','.join(['?'] * len(allowed))
-        province_filter_sql = f"AND m.province IN ({placeholders})"
-        province_params = allowed
-
-    query = f"""
-        SELECT a.id, a.machine_id, a.type, a.message, a.time,
-               m.host, m.city, m.province,
-               COALESCE(s.is_read, 0) as is_read
-        FROM app_alerts a
-        JOIN machines m ON a.machine_id = m.id
-        LEFT JOIN alert_status s ON a.id = s.alert_id AND s.username = ?
-        WHERE (s.is_cleared IS NULL OR s.is_cleared = 0)
-        {province_filter_sql}
-        ORDER BY a.id DESC LIMIT 20
-    """
-    
-    params = [current_user] + province_params
-    alerts = conn.execute(query, params).fetchall()
-    
-    unread_query = f"""
-        SELECT COUNT(*)
-        FROM app_alerts a
-        JOIN machines m ON a.machine_id = m.id
-        LEFT JOIN alert_status s ON a.id = s.alert_id AND s.username = ?
-        WHERE (s.is_read IS NULL OR s.is_read = 0)
-          AND (s.is_cleared IS NULL OR s.is_cleared = 0)
-          {province_filter_sql}
-    """
-    unread = conn.execute(unread_query, params).fetchone()[0]
-    
-    conn.close()
-    return jsonify({"alerts": [dict(a) for a in alerts], "unread_count": unread})
+        province_filter_sql = "AND m.province IN (SELECT value FROM json_each(?))"
+        province_params = [scope_json(allowed)]
 
-@app.route('/api/alerts/read', methods=['POST'])
-def mark_alerts_read():
-    current_user = request.headers.get('X-User-Name')
-    user_role = request.headers.get('X-User-Role', 'user')
-    user_groups_str = request.headers.get('X-User-Groups', '[]')
-    
-    if not current_user: return jsonify({"success": False, "error": "No User Context"}), 403
+    # Keyset pagination: ?before=<id> untuk halaman alert yang lebih lama
+    before = request.args.get('before', type=int)
+    limit = max(1, min(request.args.get('limit', ALERTS_PAGE_SIZE, type=int), ALERTS_MAX_PAGE_SIZE))
+    cursor_sql = "AND a.id < ?" if before else ""
+    cursor_params = [before] if before else []
 
     conn = get_db_connection()
     try:
-        province_join = ""
-        province_where = ""
-        province_params = []
-        
-        if user_role != 'admin':
-            user_groups = json.loads(user_groups_str) if user_groups_str else []
-            allowed = get_allowed_provinces(conn, user_groups)
-            if not allowed:
-                return jsonify({"success": True})
-            
-            placeholders = ','.join(['?'] * len(allowed))
-            province_join = "JOIN machines m ON a.machine_id = m.id"
-            province_where = f"AND m.province IN ({placeholders})"
-            province_params = allowed
-
-        query_ids = f"""
-            SELECT a.id FROM app_alerts a
-            {province_join}
+        read_upto, cleared_upto = get_watermarks(conn, current_user)
+
+        # Alert terlihat jika di atas watermark clear dan tidak punya pengecualian 'cleared'
+        query = f"""
+            SELECT a.id, a.machine_id, a.type, a.message, a.time,
+                   m.host, m.city, m.province,
+                   (a.id <= ? OR COALESCE(s.is_read, 0) = 1) as is_read
+            FROM app_alerts a
+            JOIN machines m ON a.machine_id = m.id
             LEFT JOIN alert_status s ON a.id = s.alert_id AND s.username = ?
-            WHERE (s.is_cleared IS NULL OR s.is_cleared = 0)
-            {province_where}
+            WHERE a.id > ? AND COALESCE(s.is_cleared, 0) = 0
+            {cursor_sql}
+            {province_filter_sql}
+            ORDER BY a.id DESC LIMIT ?
         """
-        params_select = [current_user] + province_params
-        
-        pending_alerts = conn.execute(query_ids, params_select).fetchall()
-
-        for row in pending_alerts:
-            aid = row['id']
-            exists = conn.execute("SELECT 1 FROM alert_status WHERE alert_id=? AND username=?", (aid, current_user)).fetchone()
-            if exists:
-                conn.execute("UPDATE alert_status SET is_read=1 WHERE alert_id=? AND username=?", (aid, current_user))
-            else:
-                conn.execute("INSERT INTO alert_status (alert_id, username, is_read, is_cleared) VALUES (?, ?, 1, 0)", (aid, current_user))
         
-        conn.commit()
-        return jsonify({"success": True})
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+        params = [read_upto, current_user, cleared_upto] + cursor_params + province_params + [limit + 1]
+        alerts = conn.execute(query, params).fetchall()
+
+        # Badge hanya dihitung untuk halaman pertama (polling)
+        unread = None if before else unread_count(
+            conn, current_user, allowed, province_params[0] if province_params else None)
     finally:
         conn.close()
 
-@app.route('/api/alerts/clear', methods=['POST'])
-def clear_alerts():
+    has_more = len(alerts) > limit
+    alerts = alerts[:limit]
+    return jsonify({
+        "alerts": [dict(a) for a in alerts],
+        "unread_count": unread,
+        "next_cursor": alerts[-1]['id'] if has_more else None
+    })
+
+def update_alert_state(mark_all, cleared=False):
+    """Body opsional {"ids": [...]}: tandai alert tertentu, tanpa body: semua alert.
+    Watermark berlaku global per user; alert di luar scope memang tidak pernah terlihat."""
     current_user = request.headers.get('X-User-Name')
-    user_role = request.headers.get('X-User-Role', 'user')
-    user_groups_str = request.headers.get('X-User-Groups', '[]')
     
     if not current_user: return jsonify({"success": False, "error": "No User Context"}), 403
 
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if ids is not None and not isinstance(ids, list):
+        return jsonify({"success": False, "error": "ids harus berupa list"}), 400
+
     conn = get_db_connection()
     try:
-        province_join = ""
-        province_where = ""
-        province_params = []
-        
-        if user_role != 'admin':
-            user_groups = json.loads(user_groups_str) if user_groups_str else []
-            allowed = get_allowed_provinces(conn, user_groups)
-            if not allowed: return jsonify({"success": True})
-            
-            placeholders = ','.join(['?'] * len(allowed))
-            province_join = "JOIN machines m ON a.machine_id = m.id"
-            province_where = f"AND m.province IN ({placeholders})"
-            province_params = allowed
-
-        query_ids = f"""
-            SELECT a.id FROM app_alerts a
-            {province_join}
-            WHERE 1=1 {province_where}
-        """
-        pending_alerts = conn.execute(query_ids, province_params).fetchall()
-        
-        for row in pending_alerts:
-            aid = row['id']
-            exists = conn.execute("SELECT 1 FROM alert_status WHERE alert_id=? AND username=?", (aid, current_user)).fetchone()
-            if exists:
-                conn.execute("UPDATE alert_status SET is_cleared=1 WHERE alert_id=? AND username=?", (aid, current_user))
-            else:
-                conn.execute("INSERT INTO alert_status (alert_id, username, is_read, is_cleared) VALUES (?, ?, 1, 1)", (aid, current_user))
-
+        if ids is not None:
+            mark_ids(conn, current_user, ids, cleared=cleared)
+        else:
+            mark_all(conn, current_user)
         conn.commit()
         return jsonify({"success": True})
     except Exception as e:
@@ -516,37 +508,107 @@ def clear_alerts():
     finally:
         conn.close()
 
+@app.route('/api/alerts/read', methods=['POST'])
+def mark_alerts_read():
+    return update_alert_state(mark_all_read)
+
+@app.route('/api/alerts/clear', methods=['POST'])
+def clear_alerts():
+    return update_alert_state(mark_all_cleared, cleared=True)
+
+def resolve_status_provinces():
+    """Provinsi yang boleh dilihat user request ini (frozenset dari cache scope), None untuk admin."""
+    if request.headers.get('X-User-Role', 'user') == 'admin':
+        return None
+    return scope_cache.provinces_for(parse_groups(request.headers.get('X-User-Groups')))
+
+def get_status_entry(provinces, since, fmt='rows'):
+    """Payload /api/status yang sudah diserialisasi: penuh jika since None, selain itu delta."""
+    store.ensure_loaded()
+    scope_key = scope_key_for(provinces)
+
+    if since is None:
+        if fmt == 'columnar':
+            return status_cache.get(f"{scope_key}#columnar",
+                                    lambda: status_payload(store.status(provinces), fmt),
+                                    COLUMNAR_JSON_MIME)
+        if fmt == 'binary':
+            return status_cache.get(f"{scope_key}#binary",
+                                    lambda: status_payload(store.status(provinces), fmt),
+                                    COLUMNAR_BINARY_MIME)
+        # Response penuh (load pertama), format lama berupa list
+        return status_cache.get(scope_key, lambda: store.status(provinces))
+
+    # Delta sejak siklus `since`; full jika klien sudah terlalu tertinggal
+    def build_delta():
+        delta = store.delta(since, provinces)
+        if delta is None:
+            return {"seq": store.version, "full": True, "machines": store.status(provinces)}
+        return delta
+    return status_cache.get(f"{scope_key}@{since}", build_delta)
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
-    conn = get_db_connection()
-    user_role = request.headers.get('X-User-Role', 'user')
-    user_groups_str = request.headers.get('X-User-Groups', '[]')
-    try:
-        user_groups = json.loads(user_groups_str)
-    except:
-        user_groups = []
+    # Data node & history diambil dari fleet store di memori
+    provinces = resolve_status_provinces()
+    entry = get_status_entry(provinces, request.args.get('since', type=int), negotiate_format(request))
 
-    machines = conn.execute("SELECT * FROM machines").fetchall()
-    filtered_machines = []
-    
-    if user_role == 'admin':
-        filtered_machines = machines
+    if entry.etag in request.if_none_match:
+        resp = Response(status=304)
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        resp = Response(entry.gzip_body, mimetype=entry.mimetype)
+        resp.headers['Content-Encoding'] = 'gzip'
     else:
-        allowed_provinces = get_allowed_provinces(conn, user_groups)
-        
-        for m in machines:
-            if m['province'] in allowed_provinces:
-                filtered_machines.append(m)
-    
-    result = []
-    for m in filtered_machines:
-        m_dict = dict(m)
-        history = conn.execute("SELECT time, status, latency, rx, tx FROM history WHERE machine_id=? ORDER BY id DESC LIMIT 60", (m['id'],)).fetchall()
-        m_dict['history'] = [dict(h) for h in reversed(history)]
-        result.append(m_dict)
-    
-    conn.close()
-    return jsonify(result)
+        resp = Response(entry.body, mimetype=entry.mimetype)
+
+    resp.set_etag(entry.etag)
+    resp.headers['X-Status-Seq'] = str(entry.version)
+    resp.headers['Vary'] = 'Accept, Accept-Encoding'
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+@app.route('/api/stream', methods=['GET'])
+def stream_events():
+    """Server-Sent Events: delta status tiap siklus monitor dan alert baru, sesuai scope user."""
+    provinces = resolve_status_provinces()
+
+    # EventSource mengirim Last-Event-ID saat reconnect
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', -1, type=int)
+
+    events = hub.subscribe()
+
+    def generate():
+        last_seq = since
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = events.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+
+                if event['type'] == 'status':
+                    entry = get_status_entry(provinces, last_seq)
+                    if entry.version == last_seq:
+                        continue
+                    last_seq = entry.version
+                    yield f"id: {entry.version}\nevent: status\ndata: {entry.body.decode('utf-8')}\n\n"
+
+                elif event['type'] == 'alert':
+                    alert = event['alert']
+                    if provinces is not None and alert['province'] not in provinces:
+                        continue
+                    yield f"event: alert\ndata: {json.dumps(alert)}\n\n"
+        finally:
+            hub.unsubscribe(events)
+
+    resp = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
 
 @app.route('/api/history', methods=['POST'])
 def get_history():
@@ -557,7 +619,237 @@ def get_history():
     limit = minutes * (60 // Config.PING_INTERVAL) 
     rows = conn.execute("SELECT time, status, latency, rx, tx FROM history WHERE machine_id=? ORDER BY id DESC LIMIT ?", (mid, limit)).fetchall()
     conn.close()
-    return jsonify([dict(r) for r in reversed(rows)])
+    result = [dict(r) for r in reversed(rows)]
+
+    # Opsional: batasi jumlah titik untuk chart (LTTB + transisi status)
+    max_points = data.get('max_points')
+    if max_points:
+        try:
+            max_points = max(3, int(max_points))
+        except (TypeError, ValueError):
+            return jsonify({"error": "max_points harus berupa angka"}), 400
+        metrics = CHART_METRICS.get(data.get('metric'), DEFAULT_METRICS)
+        result = downsample_history(result, max_points, metrics)
+
+    # Opsional: format kolom (JSON ringkas atau biner)
+    fmt = negotiate_format(request, data.get('format'))
+    if fmt != 'rows':
+        body, mimetype = history_payload(result, fmt)
+        return Response(body, mimetype=mimetype)
+
+    return jsonify(result)
+
+@app.route('/api/history/batch', methods=['POST'])
+def get_history_batch():
+    """History beberapa node sekaligus (daftar ID atau satu provinsi), sejajar per bucket waktu."""
+    data = request.json or {}
+    ids = data.get('ids')
+    province = data.get('province')
+
+    if ids is None and not province:
+        return jsonify({"error": "ids atau province wajib diisi"}), 400
+    if ids is not None and not isinstance(ids, list):
+        return jsonify({"error": "ids harus berupa list"}), 400
+
+    try:
+        minutes = int(data.get('minutes', 60))
+        resolution = int(data.get('resolution') or 0)
+        max_points = int(data.get('max_points', 300))
+    except (TypeError, ValueError):
+        return jsonify({"error": "minutes, resolution dan max_points harus berupa angka"}), 400
+
+    store.ensure_loaded()
+    provinces = resolve_status_provinces()
+    machine_ids = store.select_ids(
+        ids=[str(i) for i in ids] if ids is not None else None,
+        province=province, provinces=provinces)
+
+    start, end, resolution = resolve_range(minutes, resolution, max_points)
+    conn = get_db_connection()
+    try:
+        result = bucketed_history(conn, machine_ids, start, end, resolution)
+    finally:
+        conn.close()
+
+    return jsonify(result)
+
+@app.route('/api/heatmap', methods=['POST'])
+def get_heatmap():
+    """Matriks node x waktu (latency atau availability) untuk daftar ID, satu provinsi,
+    atau seluruh fleet dalam scope user."""
+    data = request.json or {}
+    ids = data.get('ids')
+    metric = data.get('metric', 'latency')
+
+    if metric not in HEATMAP_METRICS:
+        return jsonify({"error": "metric harus latency atau availability"}), 400
+    if ids is not None and not isinstance(ids, list):
+        return jsonify({"error": "ids harus berupa list"}), 400
+
+    try:
+        minutes = int(data.get('minutes', 360))
+        resolution = int(data.get('resolution') or 0)
+        max_points = int(data.get('max_points', 120))
+    except (TypeError, ValueError):
+        return jsonify({"error": "minutes, resolution dan max_points harus berupa angka"}), 400
+
+    store.ensure_loaded()
+    machine_ids = store.select_ids(
+        ids=[str(i) for i in ids] if ids is not None else None,
+        province=data.get('province') or None,
+        provinces=resolve_status_provinces())
+
+    start, end, resolution = resolve_range(minutes, resolution, max_points)
+    conn = get_db_connection()
+    try:
+        result = heatmap_matrix(conn, machine_ids, start, end, resolution, metric)
+    finally:
+        conn.close()
+
+    return jsonify(result)
+
+@app.route('/api/machines', methods=['GET'])
+def list_machines():
+    """Listing machine dengan filter, pencarian (id/host/city), sort dan keyset pagination.
+    Halaman berikutnya diminta dengan `cursor` dari response sebelumnya."""
+    args = request.args
+    conn = get_db_connection()
+    try:
+        result = query_machines(
+            conn, resolve_status_provinces(),
+            sort=args.get('sort', 'id'),
+            order=args.get('order', 'asc'),
+            limit=args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            cursor=args.get('cursor'),
+            status=args.get('status'),
+            type_=args.get('type'),
+            province=args.get('province'),
+            city=args.get('city'),
+            q=args.get('q'))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except sqlite3.OperationalError as e:
+        # Sintaks MATCH yang tidak bisa diproses FTS5
+        return jsonify({"error": f"Query pencarian tidak valid: {e}"}), 400
+    finally:
+        conn.close()
+
+    return jsonify(result)
+
+@app.route('/api/summary', methods=['GET'])
+def get_summary():
+    """Jumlah online/offline, rata-rata latency dan total traffic per provinsi
+    (dan per kota dengan ?group=city) sesuai scope user."""
+    store.ensure_loaded()
+    provinces = resolve_status_provinces()
+    return jsonify(store.summary(provinces, by_city=request.args.get('group') == 'city'))
+
+@app.route('/api/top', methods=['GET'])
+def get_top_nodes():
+    """Top-N node terburuk saat ini: latency, rx, tx, atau flaps (perubahan status per jam)."""
+    metric = request.args.get('metric', 'latency')
+    if metric not in RANK_METRICS:
+        return jsonify({"error": f"metric harus salah satu dari: {', '.join(RANK_METRICS)}"}), 400
+
+    store.ensure_loaded()
+    return jsonify(store.top(metric,
+                             limit=request.args.get('limit', 10, type=int),
+                             provinces=resolve_status_provinces(),
+                             province=request.args.get('province') or None))
+
+@app.route('/api/map', methods=['GET'])
+def get_map_clusters():
+    """Marker peta untuk viewport: cluster grid sesuai zoom (centroid, jumlah,
+    status terburuk), node tunggal dikirim dengan info ringkas untuk marker."""
+    try:
+        west, south, east, north = [float(v) for v in request.args.get('bbox', '').split(',')]
+        zoom = int(request.args.get('zoom', 5))
+    except ValueError:
+        return jsonify({"error": "bbox (west,south,east,north) dan zoom wajib diisi"}), 400
+
+    store.ensure_loaded()
+    provinces = resolve_status_provinces()
+    latency_threshold = settings.get('latency_threshold')
+    return jsonify(viewport_clusters(scope_key_for(provinces), provinces,
+                                     (west, south, east, north), zoom, latency_threshold))
+
+EXPORT_FIELDS = ('machine_id', 'time', 'status', 'latency', 'rx', 'tx')
+export_slots = threading.BoundedSemaphore(Config.EXPORT_MAX_CONCURRENT)
+
+def parse_export_time(value):
+    return datetime.fromisoformat(value.replace('T', ' ')) if value else None
+
+def encode_export_chunk(rows, fmt):
+    if fmt == 'ndjson':
+        return "".join(json.dumps(dict(zip(EXPORT_COLUMNS, r)), separators=(',', ':')) + "\n" for r in rows)
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue()
+
+@app.route('/api/export', methods=['GET'])
+def export_history():
+    """Export history (CSV/NDJSON) beberapa node untuk rentang waktu bebas, di-stream
+    per chunk dan dikompres gzip sambil jalan sehingga memori tetap konstan."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({"error": "format harus csv atau ndjson"}), 400
+
+    try:
+        end = parse_export_time(request.args.get('to')) or datetime.now()
+        start = parse_export_time(request.args.get('from')) or \
+            end - timedelta(minutes=request.args.get('minutes', 1440, type=int))
+    except ValueError:
+        return jsonify({"error": "from/to harus berformat YYYY-MM-DD HH:MM:SS"}), 400
+
+    ids = request.args.get('ids')
+    store.ensure_loaded()
+    machine_ids = store.select_ids(
+        ids=[i for i in ids.split(',') if i] if ids else None,
+        province=request.args.get('province') or None,
+        provinces=resolve_status_provinces())
+
+    # Export besar memakan worker cukup lama, batasi yang berjalan bersamaan
+    if not export_slots.acquire(blocking=False):
+        return jsonify({"error": "Terlalu banyak export berjalan, coba lagi nanti"}), 429
+
+    use_gzip = request.args.get('gzip', '1') != '0'
+
+    def generate():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+        conn = get_db_connection()
+        try:
+            header = ",".join(EXPORT_FIELDS) + "\n" if fmt == 'csv' else ""
+            pending = header
+            for rows in iter_history_chunks(conn, machine_ids, start, end, Config.EXPORT_CHUNK_SIZE):
+                data = (pending + encode_export_chunk(rows, fmt)).encode('utf-8')
+                pending = ""
+                out = compressor.compress(data) if compressor else data
+                if out:
+                    yield out
+                # Beri kesempatan request lain (worker cooperative) di antara chunk
+                time.sleep(0)
+
+            tail = pending.encode('utf-8')
+            if compressor:
+                tail = compressor.compress(tail) + compressor.flush()
+            if tail:
+                yield tail
+        finally:
+            conn.close()
+
+    filename = f"history-{start.strftime('%Y%m%d%H%M')}-{end.strftime('%Y%m%d%H%M')}.{fmt}"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if use_gzip:
+        filename += ".gz"
+        mimetype = 'application/gzip'
+
+    resp = Response(generate(), mimetype=mimetype)
+    # Slot dilepas saat response ditutup, termasuk bila klien memutus di tengah jalan
+    resp.call_on_close(export_slots.release)
+    resp.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    resp.headers['Cache-Control'] = 'no-store'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
 
 @app.route('/add', methods=['POST'])
 @app.route('/api/add', methods=['POST'])
@@ -597,8 +889,11 @@ def add_machine():
             (id, host, type, icon, use_snmp, lat, lng, notify_down, notify_traffic, notify_email, online, city, province) 
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?)''', 
             (m_id, host, m_type, icon, use_snmp, lat, lng, n_down, n_traf, n_email, city, province))
-        
+        # Alert lama dengan id node yang sama (node pernah dihapus) kembali terlihat
+        adjust_counters(conn, "a.machine_id = ?", (m_id,), 1)
+        log_change(conn, 'upsert', m_id)
         conn.commit()
+        follower.poll()
         
         threading.Thread(target=probe_snmp, args=(m_id, host), daemon=True).start()
 
@@ -621,7 +916,7 @@ def edit_machine():
         return jsonify({"error": "Format Host atau IP Address tidak valid."}), 400
     
     conn = get_db_connection()
-    old_data = conn.execute("SELECT host, use_snmp FROM machines WHERE id=?", (m_id,)).fetchone()
+    old_data = conn.execute("SELECT host, use_snmp, province FROM machines WHERE id=?", (m_id,)).fetchone()
     conn.close()
     
     should_reprobe = False
@@ -641,6 +936,11 @@ def edit_machine():
         exist_host = conn.execute("SELECT 1 FROM machines WHERE host = ? AND id != ?", (host, m_id)).fetchone()
         if exist_host: return jsonify({"error": f"IP Address '{host}' sudah digunakan node lain!"}), 400
 
+        province_changed = old_data is not None and old_data['province'] != province
+        if province_changed:
+            # Alert node ini pindah provinsi: keluarkan dari counter provinsi lama
+            adjust_counters(conn, "a.machine_id = ?", (m_id,), -1)
+
         conn.execute('''UPDATE machines SET 
             host=?, type=?, icon=?, use_snmp=?, lat=?, lng=?,
             notify_down=?, notify_traffic=?, notify_email=?,
@@ -650,7 +950,11 @@ def edit_machine():
              int(d.get('notify_down', 1)), int(d.get('notify_traffic', 1)), int(d.get('notify_email', 0)),
              city, province,
              m_id))
+        if province_changed:
+            adjust_counters(conn, "a.machine_id = ?", (m_id,), 1)
+        log_change(conn, 'upsert', m_id)
         conn.commit()
+        follower.poll()
         
         if should_reprobe:
             sync_prometheus_targets() 
@@ -671,8 +975,12 @@ def remove_machine():
     d = request.json
     conn = get_db_connection()
     try:
+        # Alert node ini tidak lagi terlihat: keluarkan dari counter badge
+        adjust_counters(conn, "a.machine_id = ?", (d['id'],), -1)
         conn.execute("DELETE FROM machines WHERE id=?", (d['id'],))
+        log_change(conn, 'remove', d['id'])
         conn.commit()
+        follower.poll()
         
         sync_prometheus_targets()
         
@@ -693,13 +1001,33 @@ def list_users():
 def get_me():
     return jsonify({"username": "dev", "role": "admin"})
 
-if __name__ == '__main__':
-    init_db()
+def start_follower():
+    """State di memori proses ini (fleet store, index alert, SSE) mengikuti DB.
+    Dipanggil sekali per proses: worker API (gunicorn post_worker_init) dan proses monitor."""
+    restore_snapshot()
+    follower.start()
+
+def start_background():
+    """Monitor loop, deteksi HQ, sinkronisasi target & job background lainnya.
+    Hanya boleh berjalan di SATU proses (lihat serve.py)."""
+    # Simpan snapshot saat shutdown (docker stop mengirim SIGTERM)
+    atexit.register(save_snapshot)
+    settings.subscribe(on_hq_settings_changed, ('hq_manual', 'hq_detected'))
 
     threading.Thread(target=monitor_loop, daemon=True).start()
+    threading.Thread(target=snapshot_loop, daemon=True).start()
+    threading.Thread(target=retention_loop, daemon=True).start()
+    threading.Thread(target=dispatcher_loop, daemon=True).start()
     threading.Thread(target=init_hq_location, daemon=True).start()
     try:
         sync_prometheus_targets()
     except:
         pass
+
+if __name__ == '__main__':
+    # Mode development: API & background dalam satu proses (produksi: python serve.py)
+    init_db()
+    start_follower()
+    start_background()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(host=Config.FLASK_HOST, port=Config.FLASK_PORT)
@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+import numpy as np
+from datetime import datetime, timedelta
+from config import Config
+from rules import remap
+
+# Baseline latency per node (EWMA mean & variance) sebagai pengganti threshold
+# latency tunggal: link satelit yang selalu tinggi tidak dianggap masalah,
+# sedangkan node LAN yang naik jauh dari kebiasaannya tetap terdeteksi.
+# Update O(1) per sample (vektor per siklus), disimpan ke latency_baselines
+# secara berkala, dan diisi awal dari history dengan backfill vektor.
+
+# Interval penulisan baseline ke DB (detik)
+FLUSH_INTERVAL = 300
+
+
+def ewma_backfill(machine_ids, latencies, alpha):
+    """Baseline awal dari history (urut per machine lalu waktu) tanpa loop per sample:
+    bobot eksponensial (1-alpha)^umur dihitung sekaligus, lalu dijumlah per node
+    dengan bincount. Mengembalikan (ids, mean, var, samples)."""
+    ids, group, counts = np.unique(np.asarray(machine_ids, dtype=object), return_inverse=True, return_counts=True)
+    x = np.asarray(latencies, dtype=np.float64)
+    # Umur sample dihitung dari sample terakhir node-nya (0 = terbaru)
+    ends = np.cumsum(counts)[group]
+    age = ends - 1 - np.arange(len(x))
+    w = (1.0 - alpha) ** age
+
+    total = np.bincount(group, weights=w)
+    mean = np.bincount(group, weights=w * x) / total
+    var = np.bincount(group, weights=w * (x - mean[group]) ** 2) / total
+    return ids.tolist(), mean, var, counts
+
+
+class BaselineTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.node_ids = ()
+        self.mean = np.zeros(0)
+        self.var = np.zeros(0)
+        self.samples = np.zeros(0, dtype=np.int64)
+        self.streak = np.zeros(0, dtype=np.int32)
+        self.loaded = False
+        self.last_flush = 0
+
+    def load(self, conn, node_ids):
+        """Muat baseline tersimpan; node tanpa baseline di-backfill dari history."""
+        rows = {r['machine_id']: r for r in conn.execute("SELECT * FROM latency_baselines").fetchall()}
+        missing = [mid for mid in node_ids if mid not in rows]
+
+        self.node_ids = tuple(node_ids)
+        n = len(self.node_ids)
+        self.mean, self.var = np.zeros(n), np.zeros(n)
+        self.samples = np.zeros(n, dtype=np.int64)
+        self.streak = np.zeros(n, dtype=np.int32)
+        for i, mid in enumerate(self.node_ids):
+            r = rows.get(mid)
+            if r is not None:
+                self.mean[i], self.var[i], self.samples[i] = r['mean'], r['var'], r['samples']
+
+        if missing:
+            self.backfill(conn, missing)
+        self.loaded = True
+        self.last_flush = time.time()
+
+    def backfill(self, conn, machine_ids):
+        since = (datetime.now() - timedelta(hours=Config.BASELINE_BACKFILL_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
+        rows = conn.execute("""
+            SELECT machine_id, latency FROM history
+            WHERE machine_id IN (SELECT value FROM json_each(?))
+              AND status = 'ONLINE' AND time >= ?
+            ORDER BY machine_id, id
+        """, (json.dumps(list(machine_ids)), since)).fetchall()
+        if not rows:
+            return 0
+
+        ids, mean, var, counts = ewma_backfill(
+            [r['machine_id'] for r in rows], [r['latency'] for r in rows], Config.BASELINE_ALPHA)
+        pos = {mid: i for i, mid in enumerate(self.node_ids)}
+        idx = np.array([pos.get(mid, -1) for mid in ids], dtype=np.int64)
+        keep = idx >= 0
+        self.mean[idx[keep]] = mean[keep]
+        self.var[idx[keep]] = var[keep]
+        self.samples[idx[keep]] = counts[keep]
+        self.flush(conn)
+        print(f"[*] Latency baseline backfill: {int(keep.sum())} node dari {len(rows)} sample history")
+        return int(keep.sum())
+
+    def _align(self, snap):
+        if snap.ids == self.node_ids:
+            return
+        self.mean = remap(self.mean[None, :], self.node_ids, snap.ids, axis=1)[0]
+        self.var = remap(self.var[None, :], self.node_ids, snap.ids, axis=1)[0]
+        self.samples = remap(self.samples[None, :], self.node_ids, snap.ids, axis=1)[0]
+        self.streak = remap(self.streak[None, :], self.node_ids, snap.ids, axis=1)[0]
+        self.node_ids = snap.ids
+
+    def observe(self, conn, snap, now=None):
+        """Update baseline dengan latency siklus ini dan kembalikan anomali baru:
+        list (index node, latency, mean, std). Anomali = latency di atas
+        mean + BASELINE_Z * std (dan minimal BASELINE_MIN_DELTA ms) selama
+        BASELINE_ANOMALY_CYCLES siklus berturut-turut."""
+        now = time.time() if now is None else now
+        with self.lock:
+            if not self.loaded:
+                self.load(conn, snap.ids)
+            self._align(snap)
+
+            x = snap.values[0]
+            online = snap.online
+            std = np.sqrt(self.var)
+            deviation = x - self.mean
+            anomalous = (
+                online
+                & (self.samples >= Config.BASELINE_MIN_SAMPLES)
+                & (deviation > Config.BASELINE_Z * std)
+                & (deviation > Config.BASELINE_MIN_DELTA)
+            )
+            self.streak = np.where(anomalous, self.streak + 1, 0).astype(np.int32)
+            fired = np.nonzero(self.streak == Config.BASELINE_ANOMALY_CYCLES)[0]
+            anomalies = [(int(i), float(x[i]), float(self.mean[i]), float(std[i])) for i in fired]
+
+            # EWMA mean & variance (incremental), hanya untuk sample online. Sample anomali
+            # dipotong di batas anomali agar lonjakan tidak langsung "dipelajari" sebagai normal,
+            # sedangkan perubahan level yang menetap tetap diikuti perlahan.
+            alpha = Config.BASELINE_ALPHA
+            first = online & (self.samples == 0)
+            bound = np.maximum(Config.BASELINE_Z * std, Config.BASELINE_MIN_DELTA)
+            deviation = np.where(anomalous, np.minimum(deviation, bound), deviation)
+            incr = alpha * deviation
+            self.mean = np.where(first, x, np.where(online, self.mean + incr, self.mean))
+            self.var = np.where(online & ~first, (1 - alpha) * (self.var + deviation * incr), self.var)
+            self.samples = self.samples + online
+
+            if now - self.last_flush >= FLUSH_INTERVAL:
+                self.flush(conn)
+                self.last_flush = now
+            return anomalies
+
+    def flush(self, conn):
+        """Tulis baseline ke DB pada transaksi pemanggil (di-commit bersama siklus monitor)."""
+        now = time.time()
+        conn.executemany("""
+            INSERT INTO latency_baselines (machine_id, mean, var, samples, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(machine_id) DO UPDATE SET
+                mean = excluded.mean, var = excluded.var,
+                samples = excluded.samples, updated_at = excluded.updated_at
+        """, [
+            (mid, float(self.mean[i]), float(self.var[i]), int(self.samples[i]), now)
+            for i, mid in enumerate(self.node_ids) if self.samples[i]
+        ])
+
+
+def anomaly_message(latency, mean, std):
+    return f"Latency anomali: {latency:g} ms (baseline {mean:.1f} ± {std:.1f} ms)"
+
+
+baselines = BaselineTracker()
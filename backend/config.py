@@ -68,15 +68,52 @@ class Config:
     FLASK_HOST = os.getenv("FLASK_HOST", "0.0.0.0")
     FLASK_PORT = int(os.getenv("FLASK_PORT", 5000))
 
+    # Production Serving (python serve.py)
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", os.cpu_count() or 2))
+    WEB_WORKER_CONNECTIONS = int(os.getenv("WEB_WORKER_CONNECTIONS", 1000))
+    FOLLOWER_INTERVAL = float(os.getenv("FOLLOWER_INTERVAL", 1.0))
+
+    # Warm Start Snapshot
+    SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE") or os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), "state.json.gz")
+    SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", 300))
+    HQ_CACHE_TTL = int(os.getenv("HQ_CACHE_TTL", 86400))
+
+    # History Export
+    EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", 2))
+    EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))
+
+    # Alert Retention
+    ALERT_RETENTION_DAYS = int(os.getenv("ALERT_RETENTION_DAYS", 30))
+    ALERT_PURGE_CHUNK = int(os.getenv("ALERT_PURGE_CHUNK", 2000))
+    ALERT_PURGE_INTERVAL = int(os.getenv("ALERT_PURGE_INTERVAL", 3600))
+
     # Email Config
     BANDWIDTH_THRESHOLD = int(os.getenv("BANDWIDTH_THRESHOLD", 10000000))
     ALERT_COOLDOWN = int(os.getenv("ALERT_COOLDOWN", 3600))
+    ALERT_FLAP_WINDOW = int(os.getenv("ALERT_FLAP_WINDOW", 600))
+    ALERT_FLAP_THRESHOLD = int(os.getenv("ALERT_FLAP_THRESHOLD", 4))
+    ALERT_GROUP_MIN = int(os.getenv("ALERT_GROUP_MIN", 5))
+
+    # Baseline Latency (EWMA) & Anomali
+    BASELINE_ALPHA = float(os.getenv("BASELINE_ALPHA", 0.05))
+    BASELINE_Z = float(os.getenv("BASELINE_Z", 4.0))
+    BASELINE_MIN_DELTA = float(os.getenv("BASELINE_MIN_DELTA", 20))  # ms
+    BASELINE_MIN_SAMPLES = int(os.getenv("BASELINE_MIN_SAMPLES", 30))
+    BASELINE_ANOMALY_CYCLES = int(os.getenv("BASELINE_ANOMALY_CYCLES", 3))
+    BASELINE_BACKFILL_HOURS = int(os.getenv("BASELINE_BACKFILL_HOURS", 24))
     ALERT_RECIPIENT = os.getenv("ALERT_RECIPIENT")
     SMTP_SERVER = os.getenv("SMTP_SERVER")
     SMTP_PORT = int(os.getenv("SMTP_PORT", 25))
     SMTP_EMAIL = os.getenv("SMTP_EMAIL")
     SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 
+    # Email Dispatcher (outbox + digest)
+    EMAIL_DIGEST_WINDOW = int(os.getenv("EMAIL_DIGEST_WINDOW", 60))
+    EMAIL_DIGEST_GROUP = os.getenv("EMAIL_DIGEST_GROUP", "province")  # province | recipient
+    EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+    EMAIL_RETRY_BASE = int(os.getenv("EMAIL_RETRY_BASE", 30))
+    EMAIL_RETRY_MAX = int(os.getenv("EMAIL_RETRY_MAX", 1800))
+
     # Turnstile
     TURNSTILE_SECRET_KEY = os.getenv("TURNSTILE_SECRET_KEY")
 
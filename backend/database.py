@@ -1,5 +1,8 @@
 import sqlite3
+import time
+import uuid
 from config import Config
+from alert_state import rebuild_counters
 
 def get_db_connection():
     conn = sqlite3.connect(Config.DB_FILE, check_same_thread=False, timeout=30)
@@ -9,6 +12,33 @@ def get_db_connection():
     
     return conn
 
+# Entri fleet_log yang mengubah isi fleet store (dan versi /api/status)
+FLEET_KINDS = ('cycle', 'upsert', 'remove')
+
+def log_change(conn, kind, machine_id=None, ref_id=None):
+    """Catat perubahan state bersama ke fleet_log pada transaksi pemanggil.
+    Setiap proses (worker API & monitor) menerapkan log ini berurutan lewat
+    follower.py, sehingga versi fleet store identik di semua proses.
+    kind: cycle (ref_id = id history terakhir), upsert/remove (machine_id),
+    settings, scope (province_rules). Hanya FLEET_KINDS yang menaikkan versi fleet."""
+    cur = conn.execute(
+        "INSERT INTO fleet_log (kind, machine_id, ref_id, created_at) VALUES (?, ?, ?, ?)",
+        (kind, machine_id, ref_id, time.time()))
+    if kind in FLEET_KINDS:
+        conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('fleet_version', ?)",
+                     (str(cur.lastrowid),))
+    return cur.lastrowid
+
+def fleet_version(conn):
+    """Seq fleet_log terakhir yang mengubah fleet store (versi ETag/delta /api/status)."""
+    row = conn.execute("SELECT value FROM settings WHERE key = 'fleet_version'").fetchone()
+    return int(row[0]) if row else 0
+
+def latest_change_seq(conn):
+    """Seq tertinggi yang pernah dipakai fleet_log (tetap benar setelah log lama dipangkas)."""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'fleet_log'").fetchone()
+    return row[0] if row else 0
+
 def add_column_if_not_exists(cursor, table, column, col_type):
     try:
         cursor.execute(f"SELECT {column} FROM {table} LIMIT 1")
@@ -16,8 +46,54 @@ def add_column_if_not_exists(cursor, table, column, col_type):
         print(f"[*] Migrating: Adding column '{column}' to table '{table}'...")
         cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
 
+def init_machines_fts(cursor):
+    """Index full-text (FTS5) untuk pencarian id, host & city. Trigger hanya
+    bereaksi pada kolom yang diindex, jadi update status per siklus tidak ikut
+    menulis ke index. Jika SQLite tanpa FTS5, pencarian memakai LIKE prefix."""
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS machines_fts USING fts5(
+                id, host, city,
+                content='machines', content_rowid='rowid',
+                tokenize="unicode61 tokenchars '.-_'"
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"[!] FTS5 tidak tersedia, pencarian machine memakai LIKE: {e}")
+        return
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS machines_fts_ai AFTER INSERT ON machines BEGIN
+            INSERT INTO machines_fts(rowid, id, host, city) VALUES (new.rowid, new.id, new.host, new.city);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS machines_fts_ad AFTER DELETE ON machines BEGIN
+            INSERT INTO machines_fts(machines_fts, rowid, id, host, city) VALUES ('delete', old.rowid, old.id, old.host, old.city);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS machines_fts_au AFTER UPDATE OF id, host, city ON machines BEGIN
+            INSERT INTO machines_fts(machines_fts, rowid, id, host, city) VALUES ('delete', old.rowid, old.id, old.host, old.city);
+            INSERT INTO machines_fts(rowid, id, host, city) VALUES (new.rowid, new.id, new.host, new.city);
+        END
+    ''')
+    # Rowid tabel machines (tanpa INTEGER PRIMARY KEY) bisa berubah setelah VACUUM,
+    # rebuild saat startup menjaga index selalu sinkron (murah untuk ukuran inventaris)
+    cursor.execute("INSERT INTO machines_fts(machines_fts) VALUES ('rebuild')")
+
+def enable_incremental_vacuum(conn):
+    """auto_vacuum hanya bisa diubah lewat VACUUM penuh: dilakukan sekali saat migrasi,
+    setelahnya purge alert cukup memanggil PRAGMA incremental_vacuum."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    print("[*] Migrating: Enabling auto_vacuum=INCREMENTAL (VACUUM sekali)...")
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
 def init_db():
     conn = get_db_connection()
+    enable_incremental_vacuum(conn)
     c = conn.cursor()
 
     # 1. Tabel Machines
@@ -47,6 +123,17 @@ def init_db():
     add_column_if_not_exists(c, "machines", "notify_email", "BOOLEAN DEFAULT 0")
     add_column_if_not_exists(c, "machines", "city", "TEXT DEFAULT ''")
     add_column_if_not_exists(c, "machines", "province", "TEXT DEFAULT ''")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_machines_province ON machines(province)")
+
+    # Index untuk listing /api/machines (filter + sort keyset). Ekspresi traffic
+    # harus sama dengan SORT_COLUMNS di inventory.py agar index terpakai.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_machines_city ON machines(province, city)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_machines_type ON machines(type)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_machines_online ON machines(online, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_machines_latency ON machines(latency_ms, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_machines_traffic ON machines((rx_rate + tx_rate), id)")
+
+    init_machines_fts(c)
 
     # 2. Tabel History & Alerts (Sama seperti sebelumnya)
     c.execute('''
@@ -61,6 +148,11 @@ def init_db():
             FOREIGN KEY(machine_id) REFERENCES machines(id) ON DELETE CASCADE
         )
     ''')
+    # Index untuk mengambil history terbaru per node tanpa full scan
+    c.execute("CREATE INDEX IF NOT EXISTS idx_history_machine_id ON history(machine_id, id)")
+    # Index untuk query rentang waktu per node (batch history, export)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_history_machine_time ON history(machine_id, time)")
+
     c.execute('''
         CREATE TABLE IF NOT EXISTS app_alerts (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -102,6 +194,117 @@ def init_db():
             FOREIGN KEY(alert_id) REFERENCES app_alerts(id) ON DELETE CASCADE
         )
     ''')
+    # Keyset pagination alert per scope: join ke machines dilayani index covering
+    c.execute("CREATE INDEX IF NOT EXISTS idx_app_alerts_machine ON app_alerts(machine_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_machines_scope ON machines(id, province, host, city)")
+
+    # alert_status kini hanya berisi pengecualian per alert di atas watermark user
+    c.execute("CREATE INDEX IF NOT EXISTS idx_alert_status_user ON alert_status(username, alert_id)")
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS alert_watermarks (
+            username TEXT PRIMARY KEY,
+            read_upto INTEGER DEFAULT 0,
+            cleared_upto INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Counter badge unread = alert_totals - alert_seen per provinsi (lihat alert_state.py)
+    counters_missing = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'alert_totals'").fetchone() is None
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS alert_totals (
+            province TEXT PRIMARY KEY,
+            total INTEGER DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS alert_seen (
+            username TEXT,
+            province TEXT,
+            seen INTEGER DEFAULT 0,
+            PRIMARY KEY (username, province)
+        ) WITHOUT ROWID
+    ''')
+
+    # Arsip alert yang melewati retensi: jumlah per node, per hari, per tipe
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS alert_archive (
+            machine_id TEXT,
+            day TEXT,
+            type TEXT,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (machine_id, day, type)
+        ) WITHOUT ROWID
+    ''')
+
+    # Cooldown/dedup alert per node & tipe, bertahan setelah restart & dipakai bersama antar proses
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS alert_cooldowns (
+            machine_id TEXT,
+            alert_type TEXT,
+            last_fired REAL,
+            PRIMARY KEY (machine_id, alert_type)
+        ) WITHOUT ROWID
+    ''')
+
+    # Rule alert deklaratif (lihat rules.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS alert_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            metric TEXT NOT NULL,
+            op TEXT DEFAULT '>',
+            threshold REAL NOT NULL,
+            consecutive INTEGER DEFAULT 1,
+            scope TEXT DEFAULT 'all',
+            scope_value TEXT DEFAULT '',
+            enabled INTEGER DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Baseline latency EWMA per node (lihat baselines.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS latency_baselines (
+            machine_id TEXT PRIMARY KEY,
+            mean REAL,
+            var REAL,
+            samples INTEGER,
+            updated_at REAL
+        )
+    ''')
+
+    # Outbox email alert yang dikirim dispatcher di background (lihat alerts.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            machine_id TEXT,
+            province TEXT,
+            alert_type TEXT,
+            message TEXT,
+            recipient TEXT,
+            created_at REAL,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL,
+            last_error TEXT,
+            sent_at REAL
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_pending ON email_outbox(status, next_attempt_at)")
+
+    # Log perubahan state yang diikuti semua proses (lihat follower.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS fleet_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            machine_id TEXT,
+            ref_id INTEGER,
+            created_at REAL
+        )
+    ''')
 
     # Seed Default Settings jika belum ada
     default_settings = [
@@ -110,6 +313,15 @@ def init_db():
     ]
     for key, val in default_settings:
         c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", (key, val))
+    # Epoch fleet store dipakai bersama semua proses (ETag & seq delta konsisten antar worker)
+    c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('fleet_epoch', ?)", (uuid.uuid4().hex[:8],))
+    c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('fleet_version', ?)",
+              (str(latest_change_seq(conn)),))
+
+    # Migrasi: counter badge dihitung sekali dari alert yang sudah ada
+    if counters_missing:
+        print("[*] Migrating: Building alert unread counters...")
+        rebuild_counters(conn)
 
     conn.commit()
     conn.close()
@@ -0,0 +1,70 @@
+# Downsampling history untuk chart: Largest-Triangle-Three-Buckets (LTTB)
+# untuk metrik numerik, transisi status selalu dipertahankan apa adanya.
+
+# Metrik yang di-downsample untuk setiap pilihan chart di dashboard
+CHART_METRICS = {
+    'latency': ('latency',),
+    'bandwidth': ('rx', 'tx'),
+    'status': (),
+}
+DEFAULT_METRICS = ('latency', 'rx', 'tx')
+
+
+def lttb_indices(values, threshold):
+    """Index titik yang dipilih LTTB. Sumbu x memakai urutan sample
+    (interval monitor tetap), sumbu y nilai metrik."""
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    selected = [0]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Titik rata-rata bucket berikutnya sebagai titik ketiga segitiga
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        avg_x = (next_start + next_end - 1) / 2
+        avg_y = sum(values[next_start:next_end]) / (next_end - next_start)
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = a, values[a]
+
+        max_area = -1
+        chosen = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (values[j] - ay) - (ax - j) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                chosen = j
+
+        selected.append(chosen)
+        a = chosen
+
+    selected.append(n - 1)
+    return selected
+
+
+def downsample_history(rows, max_points, metrics=DEFAULT_METRICS):
+    """rows: list dict history urut waktu. Mengembalikan subset rows dengan
+    sekitar max_points titik (bisa lebih jika transisi status lebih banyak)."""
+    n = len(rows)
+    if n <= max_points:
+        return rows
+
+    # Titik sebelum & sesudah setiap perubahan status tidak boleh hilang
+    keep = {0, n - 1}
+    for i in range(1, n):
+        if rows[i]['status'] != rows[i - 1]['status']:
+            keep.add(i - 1)
+            keep.add(i)
+
+    if metrics:
+        budget = max(3, (max_points - len(keep)) // len(metrics))
+        for metric in metrics:
+            values = [r[metric] or 0 for r in rows]
+            keep.update(lttb_indices(values, budget))
+
+    return [rows[i] for i in sorted(keep)]
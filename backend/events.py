@@ -0,0 +1,42 @@
+import queue
+import threading
+
+# Kapasitas antrian per subscriber. Subscriber yang terlalu lambat akan
+# kehilangan event lama; event 'status' berikutnya tetap membawa delta lengkap.
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class EventHub:
+    """Fan-out event dari monitor loop ke semua stream SSE yang terhubung."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def publish(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # Buang event terlama agar event terbaru tetap masuk
+                try:
+                    q.get_nowait()
+                    q.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+
+
+hub = EventHub()
@@ -0,0 +1,512 @@
+import heapq
+import json
+import threading
+import time
+import uuid
+from array import array
+from collections import deque
+from database import get_db_connection, latest_change_seq, fleet_version
+
+# Jumlah sample terakhir per node yang ditampilkan di dashboard
+STATUS_HISTORY_LEN = 60
+
+# Kolom konfigurasi machine (diubah lewat add/edit, bukan oleh monitor)
+CONFIG_FIELDS = (
+    'id', 'host', 'type', 'icon', 'use_snmp', 'lat', 'lng',
+    'notify_down', 'notify_traffic', 'notify_email', 'city', 'province'
+)
+# Kolom state yang diupdate setiap siklus monitor
+STATE_FIELDS = ('online', 'latency_ms', 'rx_rate', 'tx_rate', 'last_seen')
+
+# Jumlah node yang dihapus/pindah provinsi yang diingat untuk delta /api/status
+REMOVED_LOG_LEN = 1000
+
+# Ranking node terburuk: ukuran top-K per metrik (global & per provinsi)
+# dan jendela waktu hitungan perubahan status (flap)
+TOP_K = 50
+FLAP_WINDOW = 3600
+RANK_METRICS = ('latency', 'rx', 'tx', 'flaps')
+
+
+class SampleRing:
+    """Ring buffer ukuran tetap untuk sample terbaru satu node."""
+    __slots__ = ('capacity', 'start', 'size', 'seqs', 'times', 'online', 'latency', 'rx', 'tx')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.seqs = array('q', [0]) * capacity
+        self.times = [None] * capacity
+        self.online = bytearray(capacity)
+        self.latency = array('d', [0.0]) * capacity
+        self.rx = array('d', [0.0]) * capacity
+        self.tx = array('d', [0.0]) * capacity
+
+    def append(self, time_str, is_online, latency, rx, tx, seq=0):
+        if self.size < self.capacity:
+            idx = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            idx = self.start
+            self.start = (self.start + 1) % self.capacity
+
+        self.seqs[idx] = seq
+        self.times[idx] = time_str
+        self.online[idx] = 1 if is_online else 0
+        self.latency[idx] = latency or 0
+        self.rx[idx] = rx or 0
+        self.tx[idx] = tx or 0
+
+    def rows(self):
+        """Sample urut dari yang terlama: [time, status, latency, rx, tx]."""
+        out = []
+        for i in range(self.size):
+            idx = (self.start + i) % self.capacity
+            out.append([
+                self.times[idx],
+                "ONLINE" if self.online[idx] else "OFFLINE",
+                self.latency[idx], self.rx[idx], self.tx[idx]
+            ])
+        return out
+
+    def to_list(self):
+        return [
+            {"time": t, "status": st, "latency": lat, "rx": rx, "tx": tx}
+            for t, st, lat, rx, tx in self.rows()
+        ]
+
+    def since(self, seq):
+        """Sample yang ditambahkan setelah versi store `seq`, urut dari yang terlama."""
+        out = []
+        for i in range(self.size - 1, -1, -1):
+            idx = (self.start + i) % self.capacity
+            if self.seqs[idx] <= seq:
+                break
+            out.append({
+                "time": self.times[idx],
+                "status": "ONLINE" if self.online[idx] else "OFFLINE",
+                "latency": self.latency[idx], "rx": self.rx[idx], "tx": self.tx[idx]
+            })
+        out.reverse()
+        return out
+
+
+class NodeRecord:
+    """Konfigurasi, state terakhir dan sample terbaru satu machine."""
+    __slots__ = CONFIG_FIELDS + STATE_FIELDS + ('samples', 'changed_seq', 'flaps')
+
+    def __init__(self, row, seq=0):
+        for field in CONFIG_FIELDS + STATE_FIELDS:
+            setattr(self, field, row[field] if field in row.keys() else None)
+        self.samples = SampleRing(STATUS_HISTORY_LEN)
+        # Versi store terakhir saat konfigurasi atau status online node berubah
+        self.changed_seq = seq
+        # Waktu (epoch) perubahan online/offline dalam FLAP_WINDOW terakhir
+        self.flaps = deque()
+
+    def probed(self):
+        """False sebelum probe pertama: online=0 di DB hanya default, bukan status
+        hasil probe, jadi perubahan pertama bukan perubahan status (flap)."""
+        return bool(self.last_seen) and self.last_seen != 'Never'
+
+    def update_config(self, row):
+        for field in CONFIG_FIELDS:
+            if field in row.keys():
+                setattr(self, field, row[field])
+
+    def to_dict(self):
+        d = {field: getattr(self, field) for field in CONFIG_FIELDS + STATE_FIELDS}
+        d['history'] = self.samples.to_list()
+        return d
+
+
+class SummaryCounter:
+    """Agregat status node satu provinsi/kota, diupdate inkremental oleh store."""
+    __slots__ = ('total', 'online', 'latency_sum', 'rx', 'tx')
+
+    def __init__(self):
+        self.total = 0
+        self.online = 0
+        self.latency_sum = 0.0
+        self.rx = 0.0
+        self.tx = 0.0
+
+    def add(self, node, sign):
+        self.total += sign
+        if node.online:
+            self.online += sign
+            self.latency_sum += sign * (node.latency_ms or 0)
+            self.rx += sign * (node.rx_rate or 0)
+            self.tx += sign * (node.tx_rate or 0)
+            if self.online == 0:
+                # Hindari sisa pembulatan float setelah banyak tambah/kurang
+                self.latency_sum = self.rx = self.tx = 0.0
+
+    def merge(self, other):
+        self.total += other.total
+        self.online += other.online
+        self.latency_sum += other.latency_sum
+        self.rx += other.rx
+        self.tx += other.tx
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "online": self.online,
+            "offline": self.total - self.online,
+            "avg_latency": round(self.latency_sum / self.online, 2) if self.online else None,
+            "rx": round(self.rx, 2),
+            "tx": round(self.tx, 2)
+        }
+
+
+class FleetStore:
+    """State seluruh fleet di memori. Monitor menulis, /api/status membaca."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.nodes = {}
+        self.history_id = 0
+        self.loaded = False
+        # version = seq fleet_log terakhir yang mengubah isi store (FLEET_KINDS), sama di semua proses;
+        # epoch dibaca dari DB saat load dan berubah hanya jika DB dibuat ulang
+        self.version = 0
+        # Posisi fleet_log saat load terakhir (follower melanjutkan dari sini)
+        self.log_seq = 0
+        self.epoch = uuid.uuid4().hex[:8]
+        # Info untuk delta: versi saat load, versi tiap siklus, dan log node yang hilang
+        self.load_seq = 0
+        self.cycle_seqs = deque(maxlen=STATUS_HISTORY_LEN)
+        self.removed = deque()
+        self.removed_horizon = 0
+        # Ringkasan per provinsi dan per (provinsi, kota)
+        self.province_summary = {}
+        self.city_summary = {}
+        # Node dikelompokkan per provinsi agar query ber-scope tidak iterasi seluruh fleet
+        self.province_nodes = {}
+        # Top-K per metrik: {metric: {province: [(nilai, id), ...]}}, '' = seluruh fleet
+        self.rankings = {metric: {} for metric in RANK_METRICS}
+
+    def load(self, warm_samples=None):
+        """Memuat machines dari DB. Sample diambil dari warm_samples (snapshot)
+        jika ada, sisanya dari history dengan satu query."""
+        warm_samples = warm_samples or {}
+        conn = get_db_connection()
+        try:
+            # Satu transaksi baca: machines, history dan seq fleet_log saling konsisten
+            conn.execute("BEGIN")
+            seq = latest_change_seq(conn)
+            version = fleet_version(conn)
+            epoch = conn.execute("SELECT value FROM settings WHERE key = 'fleet_epoch'").fetchone()
+            machines = conn.execute("SELECT * FROM machines").fetchall()
+            nodes = {m['id']: NodeRecord(m) for m in machines}
+
+            cold_ids = [mid for mid in nodes if mid not in warm_samples]
+            rows = []
+            if cold_ids:
+                rows = conn.execute("""
+                    SELECT h.machine_id, h.time, h.status, h.latency, h.rx, h.tx
+                    FROM json_each(?) j
+                    JOIN history h ON h.id IN (
+                        SELECT id FROM history
+                        WHERE machine_id = j.value
+                        ORDER BY id DESC LIMIT ?
+                    )
+                    ORDER BY h.machine_id, h.id
+                """, (json.dumps(cold_ids), STATUS_HISTORY_LEN)).fetchall()
+            history_id = conn.execute("SELECT MAX(id) FROM history").fetchone()[0] or 0
+        finally:
+            conn.close()
+
+        for r in rows:
+            nodes[r['machine_id']].samples.append(
+                r['time'], r['status'] == "ONLINE", r['latency'], r['rx'], r['tx'])
+        for mid, samples in warm_samples.items():
+            if mid in nodes:
+                for t, st, lat, rx, tx in samples:
+                    nodes[mid].samples.append(t, st == "ONLINE", lat, rx, tx)
+
+        with self.lock:
+            self.nodes = nodes
+            self.history_id = history_id
+            self.loaded = True
+            self.province_summary = {}
+            self.city_summary = {}
+            self.province_nodes = {}
+            for node in nodes.values():
+                self._account(node, 1)
+                self._index(node)
+            if epoch:
+                self.epoch = epoch[0]
+            self.version = version
+            self.log_seq = seq
+            self.load_seq = self.version
+            self.cycle_seqs.clear()
+            self.removed.clear()
+        print(f"[*] Fleet store loaded: {len(nodes)} nodes ({len(warm_samples)} warm).")
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.load()
+
+    def list_nodes(self):
+        with self.lock:
+            return list(self.nodes.values())
+
+    def _bump(self, version):
+        """Versi berikutnya: seq fleet_log jika diterapkan oleh follower, selain itu +1."""
+        self.version = self.version + 1 if version is None else version
+
+    def upsert(self, row, version=None):
+        """Dipanggil setelah add/edit. row adalah baris lengkap dari tabel machines."""
+        if row is None:
+            return
+        with self.lock:
+            self._bump(version)
+            node = self.nodes.get(row['id'])
+            if node is None:
+                node = self.nodes[row['id']] = NodeRecord(row, self.version)
+            else:
+                if 'province' in row.keys() and row['province'] != node.province:
+                    self._log_removed(node.id, node.province)
+                self._account(node, -1)
+                self._unindex(node)
+                node.update_config(row)
+                node.changed_seq = self.version
+            self._account(node, 1)
+            self._index(node)
+
+    def remove(self, machine_id, version=None):
+        with self.lock:
+            node = self.nodes.pop(machine_id, None)
+            if node is not None:
+                self._bump(version)
+                self._log_removed(machine_id, node.province)
+                self._account(node, -1)
+                self._unindex(node)
+
+    def _log_removed(self, machine_id, province):
+        if len(self.removed) >= REMOVED_LOG_LEN:
+            self.removed_horizon = self.removed.popleft()[0]
+        self.removed.append((self.version, machine_id, province))
+
+    def _index(self, node):
+        self.province_nodes.setdefault(node.province or '', {})[node.id] = node
+
+    def _unindex(self, node):
+        bucket = self.province_nodes.get(node.province or '')
+        if bucket is not None:
+            bucket.pop(node.id, None)
+            if not bucket:
+                del self.province_nodes[node.province or '']
+
+    def iter_nodes(self, provinces=None):
+        """Node dalam scope (None = semua). Pemanggil memegang store.lock."""
+        if provinces is None:
+            return iter(self.nodes.values())
+        return (node for p in provinces for node in self.province_nodes.get(p, {}).values())
+
+    def provinces(self):
+        """Daftar provinsi yang punya node (tanpa provinsi kosong)."""
+        with self.lock:
+            return sorted(p for p in self.province_nodes if p)
+
+    def _counters(self, node):
+        keys = ((self.province_summary, node.province or ''),
+                (self.city_summary, (node.province or '', node.city or '')))
+        for summary, key in keys:
+            counter = summary.get(key)
+            if counter is None:
+                counter = summary[key] = SummaryCounter()
+            yield summary, key, counter
+
+    def _account(self, node, sign):
+        """Menambah (sign=1) atau mengurangi (sign=-1) kontribusi node ke ringkasan."""
+        for summary, key, counter in list(self._counters(node)):
+            counter.add(node, sign)
+            if counter.total <= 0:
+                del summary[key]
+
+    def apply_cycle(self, samples, history_id, version=None):
+        """Menerapkan hasil satu siklus monitor (setelah commit ke DB)."""
+        with self.lock:
+            self._bump(version)
+            self.cycle_seqs.append(self.version)
+            now = time.time()
+            for mid, timestamp, is_online, latency, rx, tx in samples:
+                node = self.nodes.get(mid)
+                if node is None:
+                    continue
+                if bool(node.online) != is_online:
+                    node.changed_seq = self.version
+                    if node.probed():
+                        node.flaps.append(now)
+                counters = [c for _, _, c in self._counters(node)]
+                for counter in counters:
+                    counter.add(node, -1)
+                node.online = 1 if is_online else 0
+                node.latency_ms = latency if is_online else 0
+                node.rx_rate = rx if is_online else 0
+                node.tx_rate = tx if is_online else 0
+                node.last_seen = timestamp
+                for counter in counters:
+                    counter.add(node, 1)
+                node.samples.append(timestamp, is_online, latency, rx, tx, self.version)
+            self.history_id = history_id
+            self._rank(now)
+
+    def _rank(self, now):
+        """Top-K tiap metrik dengan heap berukuran tetap: O(N log K) per siklus."""
+        heaps = {metric: {} for metric in RANK_METRICS}
+        horizon = now - FLAP_WINDOW
+
+        def push(metric, province, value, mid):
+            # Node tanpa provinsi hanya masuk heap global (sekali)
+            for key in (('',) if not province else ('', province)):
+                heap = heaps[metric].setdefault(key, [])
+                if len(heap) < TOP_K:
+                    heapq.heappush(heap, (value, mid))
+                elif (value, mid) > heap[0]:
+                    heapq.heapreplace(heap, (value, mid))
+
+        for node in self.nodes.values():
+            while node.flaps and node.flaps[0] < horizon:
+                node.flaps.popleft()
+            province = node.province or ''
+            if node.flaps:
+                push('flaps', province, len(node.flaps), node.id)
+            if node.online:
+                push('latency', province, node.latency_ms or 0, node.id)
+                if node.use_snmp:
+                    push('rx', province, node.rx_rate or 0, node.id)
+                    push('tx', province, node.tx_rate or 0, node.id)
+
+        self.rankings = {
+            metric: {key: sorted(heap, reverse=True) for key, heap in by_province.items()}
+            for metric, by_province in heaps.items()
+        }
+
+    def top(self, metric, limit=10, provinces=None, province=None):
+        """Node dengan nilai tertinggi untuk metrik, dari ranking siklus terakhir.
+        Scope beberapa provinsi digabung dari list per provinsi (O(K) per provinsi)."""
+        limit = max(1, min(limit, TOP_K))
+        with self.lock:
+            ranking = self.rankings[metric]
+            if province is not None:
+                keys = [province] if provinces is None or province in provinces else []
+            elif provinces is None:
+                keys = ['']
+            else:
+                keys = list(provinces)
+
+            candidates = heapq.merge(*(ranking.get(k, []) for k in keys), reverse=True)
+            out = []
+            for value, mid in candidates:
+                node = self.nodes.get(mid)
+                # Lewati node yang dihapus/pindah provinsi sejak ranking dibuat
+                if node is None or (provinces is not None and node.province not in provinces):
+                    continue
+                if province is not None and node.province != province:
+                    continue
+                out.append({
+                    "id": mid, "host": node.host, "province": node.province,
+                    "city": node.city, "online": bool(node.online), "value": value
+                })
+                if len(out) >= limit:
+                    break
+            return {"seq": self.version, "metric": metric, "nodes": out}
+
+    def status(self, provinces=None):
+        """Isi /api/status. provinces=None berarti tanpa filter (admin)."""
+        with self.lock:
+            return [node.to_dict() for node in self.iter_nodes(provinces)]
+
+    def summary(self, provinces=None, by_city=False):
+        """Ringkasan per provinsi (dan opsional per kota) dari counter, tanpa iterasi node."""
+        with self.lock:
+            total = SummaryCounter()
+            province_rows = []
+            for province, counter in self.province_summary.items():
+                if provinces is not None and province not in provinces:
+                    continue
+                total.merge(counter)
+                province_rows.append(dict(counter.to_dict(), province=province))
+
+            result = {
+                "seq": self.version,
+                "total": total.to_dict(),
+                "provinces": sorted(province_rows, key=lambda r: r['province'])
+            }
+            if by_city:
+                result["cities"] = sorted((
+                    dict(counter.to_dict(), province=province, city=city)
+                    for (province, city), counter in self.city_summary.items()
+                    if provinces is None or province in provinces
+                ), key=lambda r: (r['province'], r['city']))
+            return result
+
+    def delta_available(self, since):
+        """Delta hanya bisa dihitung jika semua perubahan sejak `since` masih tersimpan."""
+        if since < self.load_seq or since > self.version or since < self.removed_horizon:
+            return False
+        if len(self.cycle_seqs) == self.cycle_seqs.maxlen and since < self.cycle_seqs[0]:
+            return False
+        return True
+
+    def delta(self, since, provinces=None):
+        """Node yang berubah, sample baru dan node yang hilang sejak versi `since`.
+        Mengembalikan None jika klien harus memuat ulang data lengkap."""
+        with self.lock:
+            if not self.delta_available(since):
+                return None
+
+            machines = []
+            samples = {}
+            for node in self.iter_nodes(provinces):
+                if node.changed_seq > since:
+                    machines.append(node.to_dict())
+                else:
+                    new_samples = node.samples.since(since)
+                    if new_samples:
+                        samples[node.id] = new_samples
+
+            removed = []
+            for seq, mid, province in self.removed:
+                if seq <= since or (provinces is not None and province not in provinces):
+                    continue
+                node = self.nodes.get(mid)
+                if node is None or (provinces is not None and node.province not in provinces):
+                    removed.append(mid)
+
+            return {
+                "seq": self.version,
+                "full": False,
+                "machines": machines,
+                "samples": samples,
+                "removed": list(dict.fromkeys(removed))
+            }
+
+    def select_ids(self, ids=None, province=None, provinces=None):
+        """ID node yang diminta (daftar ID, satu provinsi, atau semua jika keduanya
+        kosong) dan terlihat oleh scope `provinces`."""
+        with self.lock:
+            if ids is not None:
+                candidates = [self.nodes[mid] for mid in ids if mid in self.nodes]
+            elif province is not None:
+                candidates = list(self.province_nodes.get(province, {}).values())
+            else:
+                candidates = list(self.iter_nodes(provinces))
+            return [
+                n.id for n in candidates
+                if provinces is None or n.province in provinces
+            ]
+
+    def export_samples(self):
+        with self.lock:
+            return {mid: node.samples.rows() for mid, node in self.nodes.items()}, self.history_id
+
+
+store = FleetStore()
@@ -0,0 +1,123 @@
+import threading
+import time
+from config import Config
+from database import get_db_connection
+from fleet import store
+from settings import settings
+from access import scope_cache
+from events import hub
+
+# Follower: setiap proses (worker API maupun proses monitor) membaca fleet_log
+# dan app_alerts dari DB lalu menerapkannya ke state di memori: fleet store,
+# registry settings, cache scope, dan stream SSE. Penulis (monitor,
+# endpoint add/edit/remove, settings) hanya menulis ke DB + fleet_log lalu
+# memanggil poll() agar prosesnya sendiri langsung konsisten.
+
+
+class Follower:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.applied_seq = 0
+        self.last_alert_id = 0
+        self.started = False
+
+    def bootstrap(self):
+        """Posisi awal: state store saat load dan alert terbaru (alert lama tidak dipublish)."""
+        store.ensure_loaded()
+        conn = get_db_connection()
+        try:
+            last_alert_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM app_alerts").fetchone()[0]
+        finally:
+            conn.close()
+        with self.lock:
+            self.applied_seq = store.log_seq
+            self.last_alert_id = last_alert_id
+
+    def poll(self):
+        """Terapkan entri fleet_log & alert baru sejak poll terakhir. Aman dipanggil
+        bersamaan dari thread follower dan dari penulis (diserialisasi lock)."""
+        with self.lock:
+            conn = get_db_connection()
+            try:
+                entries = conn.execute(
+                    "SELECT * FROM fleet_log WHERE seq > ? ORDER BY seq", (self.applied_seq,)).fetchall()
+                if entries and entries[0]['seq'] != self.applied_seq + 1:
+                    # Log sudah dipangkas melewati posisi proses ini: muat ulang penuh
+                    print(f"[!] Follower tertinggal (seq {self.applied_seq}), memuat ulang fleet store")
+                    store.load()
+                    settings.refresh()
+                    scope_cache.invalidate()
+                    self.applied_seq = store.log_seq
+                    entries = []
+                    status_changed = True
+                else:
+                    status_changed = False
+
+                for entry in entries:
+                    status_changed |= self._apply(conn, entry)
+                    self.applied_seq = entry['seq']
+
+                alerts = conn.execute("""
+                    SELECT a.id, a.machine_id, a.type, a.message, a.time, m.host, m.city, m.province
+                    FROM app_alerts a
+                    JOIN machines m ON a.machine_id = m.id
+                    WHERE a.id > ?
+                    ORDER BY a.id
+                """, (self.last_alert_id,)).fetchall()
+                if alerts:
+                    self.last_alert_id = alerts[-1]['id']
+            finally:
+                conn.close()
+
+            # Beritahu stream SSE: alert baru dan perubahan fleet
+            for a in alerts:
+                hub.publish({"type": "alert", "alert": dict(a)})
+            if status_changed:
+                hub.publish({"type": "status", "seq": store.version})
+
+    def _apply(self, conn, entry):
+        """Terapkan satu entri log. Mengembalikan True jika fleet store berubah."""
+        kind, seq = entry['kind'], entry['seq']
+        if kind == 'cycle':
+            rows = conn.execute("""
+                SELECT machine_id, time, status, latency, rx, tx FROM history
+                WHERE id > ? AND id <= ?
+                ORDER BY id
+            """, (store.history_id, entry['ref_id'])).fetchall()
+            samples = [
+                (r['machine_id'], r['time'], r['status'] == "ONLINE", r['latency'], r['rx'], r['tx'])
+                for r in rows
+            ]
+            store.apply_cycle(samples, entry['ref_id'], version=seq)
+            return True
+        if kind in ('upsert', 'remove'):
+            row = conn.execute("SELECT * FROM machines WHERE id = ?", (entry['machine_id'],)).fetchone()
+            if row is None:
+                store.remove(entry['machine_id'], version=seq)
+            else:
+                store.upsert(row, version=seq)
+            return True
+        if kind == 'settings':
+            settings.refresh()
+        elif kind == 'scope':
+            scope_cache.invalidate()
+        return False
+
+    def run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[!] Follower Error: {e}")
+            time.sleep(Config.FOLLOWER_INTERVAL)
+
+    def start(self):
+        """Dipanggil sekali per proses setelah init_db/restore_snapshot."""
+        if self.started:
+            return
+        self.started = True
+        self.bootstrap()
+        threading.Thread(target=self.run, daemon=True).start()
+
+
+follower = Follower()
@@ -0,0 +1,148 @@
+import math
+import threading
+from fleet import store
+
+# Clustering marker peta di sisi server: node dikelompokkan per sel grid
+# (proyeksi Web Mercator) yang ukurannya mengikuti zoom, lalu hanya sel di
+# dalam viewport yang dikirim. Agregat dihitung sekali per versi fleet store.
+
+# Ukuran sel grid dalam pixel layar (setara maxClusterRadius Leaflet)
+CLUSTER_CELL_PX = 60
+TILE_SIZE = 256
+# Mulai zoom ini setiap node ditampilkan sendiri (sama dengan disableClusteringAtZoom)
+CLUSTER_MAX_ZOOM = 15
+MAX_ZOOM = 20
+
+# Urutan keparahan status cluster
+STATUS_RANK = {'online': 0, 'warning': 1, 'offline': 2}
+
+
+def project(lat, lng):
+    """Koordinat Web Mercator ternormalisasi [0, 1)."""
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = (lng + 180.0) / 360.0
+    s = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)
+    return x, y
+
+
+def node_status(node, latency_threshold):
+    if not node.online:
+        return 'offline'
+    if latency_threshold and (node.latency_ms or 0) > latency_threshold:
+        return 'warning'
+    return 'online'
+
+
+class ClusterCache:
+    """Cluster per (scope, zoom, threshold) untuk versi store saat ini."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.points = {}
+        self.grids = {}
+
+    def _reset_if_stale(self):
+        if self.version != store.version:
+            self.version = store.version
+            self.points = {}
+            self.grids = {}
+
+    def _points(self, scope_key, provinces, latency_threshold):
+        key = (scope_key, latency_threshold)
+        points = self.points.get(key)
+        if points is None:
+            points = []
+            with store.lock:
+                for node in store.iter_nodes(provinces):
+                    if not node.lat or not node.lng:
+                        continue
+                    x, y = project(node.lat, node.lng)
+                    points.append((node, x, y, node_status(node, latency_threshold)))
+            self.points[key] = points
+        return points
+
+    def clusters(self, scope_key, provinces, zoom, latency_threshold):
+        with self.lock:
+            self._reset_if_stale()
+            key = (scope_key, zoom, latency_threshold)
+            grid = self.grids.get(key)
+            if grid is None:
+                points = self._points(scope_key, provinces, latency_threshold)
+                grid = self.grids[key] = build_grid(points, zoom)
+            return self.version, grid
+
+
+def build_grid(points, zoom):
+    """Agregasi titik per sel: centroid, jumlah, jumlah offline, status terburuk, bounds."""
+    if zoom >= CLUSTER_MAX_ZOOM:
+        cells_per_axis = None
+    else:
+        cells_per_axis = (TILE_SIZE << zoom) / CLUSTER_CELL_PX
+
+    cells = {}
+    for node, x, y, status in points:
+        key = node.id if cells_per_axis is None else (int(x * cells_per_axis), int(y * cells_per_axis))
+        cell = cells.get(key)
+        if cell is None:
+            cells[key] = cell = {
+                "lat_sum": 0.0, "lng_sum": 0.0, "count": 0, "offline": 0,
+                "status": status, "node": node,
+                "bounds": [node.lat, node.lng, node.lat, node.lng]
+            }
+        cell["lat_sum"] += node.lat
+        cell["lng_sum"] += node.lng
+        cell["count"] += 1
+        if status == 'offline':
+            cell["offline"] += 1
+        if STATUS_RANK[status] > STATUS_RANK[cell["status"]]:
+            cell["status"] = status
+        b = cell["bounds"]
+        b[0], b[1] = min(b[0], node.lat), min(b[1], node.lng)
+        b[2], b[3] = max(b[2], node.lat), max(b[3], node.lng)
+
+    grid = []
+    for cell in cells.values():
+        count = cell["count"]
+        item = {
+            "lat": round(cell["lat_sum"] / count, 6),
+            "lng": round(cell["lng_sum"] / count, 6),
+            "count": count,
+            "offline": cell["offline"],
+            "status": cell["status"],
+        }
+        if count == 1:
+            node = cell["node"]
+            item.update({
+                "id": node.id, "host": node.host, "icon": node.icon,
+                "online": bool(node.online), "latency_ms": node.latency_ms,
+                "rx_rate": node.rx_rate, "tx_rate": node.tx_rate, "use_snmp": node.use_snmp
+            })
+        else:
+            item["bounds"] = cell["bounds"]
+        grid.append(item)
+    return grid
+
+
+def in_bbox(item, west, south, east, north):
+    if not (south <= item["lat"] <= north):
+        return False
+    if west <= east:
+        return west <= item["lng"] <= east
+    # Viewport melewati antimeridian
+    return item["lng"] >= west or item["lng"] <= east
+
+
+def viewport_clusters(scope_key, provinces, bbox, zoom, latency_threshold=None):
+    """Cluster yang centroid-nya berada di dalam bbox (west, south, east, north)."""
+    zoom = max(0, min(int(zoom), MAX_ZOOM))
+    version, grid = cluster_cache.clusters(scope_key, provinces, zoom, latency_threshold)
+    return {
+        "seq": version,
+        "zoom": zoom,
+        "clusters": [item for item in grid if in_bbox(item, *bbox)]
+    }
+
+
+cluster_cache = ClusterCache()
@@ -0,0 +1,19 @@
+from config import Config
+
+# Konfigurasi gunicorn untuk API produksi (dijalankan oleh serve.py).
+# Worker gevent: stream SSE dan export panjang tidak memonopoli satu worker.
+# Job background (monitor, HQ, sync target) TIDAK berjalan di worker.
+
+bind = f"{Config.FLASK_HOST}:{Config.FLASK_PORT}"
+workers = Config.WEB_WORKERS
+worker_class = "gevent"
+worker_connections = Config.WEB_WORKER_CONNECTIONS
+timeout = 60
+graceful_timeout = 30
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    # Setiap worker punya fleet store sendiri yang mengikuti fleet_log
+    from app import start_follower
+    start_follower()
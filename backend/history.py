@@ -0,0 +1,182 @@
+import json
+import math
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from config import Config
+
+# Batas jumlah bucket per series agar payload tetap kecil
+MAX_BUCKETS = 2000
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def wall_epoch(dt):
+    """Epoch dari waktu lokal server (sama dengan strftime('%s') di SQLite)."""
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+def resolve_range(minutes, resolution=None, max_points=300):
+    """Menghitung (start, end, resolution detik) untuk query ber-bucket."""
+    end = datetime.now()
+    start = end - timedelta(minutes=minutes)
+    span = max(1, int((end - start).total_seconds()))
+
+    if not resolution:
+        resolution = span // max(1, max_points)
+    resolution = max(int(resolution), Config.PING_INTERVAL, math.ceil(span / MAX_BUCKETS))
+
+    # Sejajarkan start ke kelipatan resolution agar bucket konsisten antar request
+    start_epoch = wall_epoch(start)
+    start_epoch -= start_epoch % resolution
+    start = datetime.fromtimestamp(start_epoch, tz=timezone.utc).replace(tzinfo=None)
+    return start, end, resolution
+
+
+def bucketed_history(conn, machine_ids, start, end, resolution):
+    """Satu query ber-index untuk banyak node: rata-rata per bucket waktu.
+    Hasil: {base, resolution, buckets, series{id: {...}}, aggregate{...}}"""
+    base = wall_epoch(start)
+    buckets = max(1, math.ceil((wall_epoch(end) - base) / resolution))
+
+    rows = conn.execute("""
+        SELECT h.machine_id,
+               (CAST(strftime('%s', h.time) AS INTEGER) - ?) / ? AS b,
+               COUNT(*) AS n,
+               SUM(h.status = 'ONLINE') AS up,
+               AVG(CASE WHEN h.status = 'ONLINE' THEN h.latency END) AS latency,
+               AVG(h.rx) AS rx,
+               AVG(h.tx) AS tx
+        FROM json_each(?) j
+        JOIN history h ON h.machine_id = j.value
+        WHERE h.time >= ? AND h.time < ?
+        GROUP BY h.machine_id, b
+    """, (base, resolution, json.dumps(machine_ids),
+          start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT))).fetchall()
+
+    def empty_series():
+        return {
+            "latency": [None] * buckets,
+            "rx": [None] * buckets,
+            "tx": [None] * buckets,
+            "availability": [None] * buckets
+        }
+
+    series = {mid: empty_series() for mid in machine_ids}
+    agg_n = [0] * buckets
+    agg_up = [0] * buckets
+    agg_lat_sum = [0.0] * buckets
+    agg_rx = [0.0] * buckets
+    agg_tx = [0.0] * buckets
+
+    for r in rows:
+        b = r['b']
+        if b < 0 or b >= buckets:
+            continue
+        s = series[r['machine_id']]
+        s['latency'][b] = round(r['latency'], 2) if r['latency'] is not None else None
+        s['rx'][b] = round(r['rx'] or 0, 2)
+        s['tx'][b] = round(r['tx'] or 0, 2)
+        s['availability'][b] = round(r['up'] / r['n'], 4)
+
+        agg_n[b] += r['n']
+        agg_up[b] += r['up']
+        if r['latency'] is not None:
+            agg_lat_sum[b] += r['latency'] * r['up']
+        agg_rx[b] += r['rx'] or 0
+        agg_tx[b] += r['tx'] or 0
+
+    # Agregat (misal overview provinsi): latency rata-rata tertimbang sample online,
+    # traffic dijumlah antar node, availability = sample online / total sample
+    aggregate = {
+        "latency": [round(agg_lat_sum[b] / agg_up[b], 2) if agg_up[b] else None for b in range(buckets)],
+        "rx": [round(agg_rx[b], 2) if agg_n[b] else None for b in range(buckets)],
+        "tx": [round(agg_tx[b], 2) if agg_n[b] else None for b in range(buckets)],
+        "availability": [round(agg_up[b] / agg_n[b], 4) if agg_n[b] else None for b in range(buckets)]
+    }
+
+    return {
+        "base": base,
+        "resolution": resolution,
+        "buckets": buckets,
+        "series": series,
+        "aggregate": aggregate
+    }
+
+
+# Kolom per baris export (urutan kolom CSV / key NDJSON)
+EXPORT_COLUMNS = ('machine_id', 'time', 'status', 'latency', 'rx', 'tx')
+
+
+def iter_history_chunks(conn, machine_ids, start, end, chunk_size):
+    """Generator chunk baris history untuk export, urut per node lalu waktu.
+    Memakai keyset (machine_id, time, id) per chunk (time tidak unik, resolusi detik):
+    setiap SELECT selesai (fetchall)
+    sebelum chunk dikirim, jadi tidak ada read transaction panjang yang
+    menahan checkpoint WAL dari writer monitor. Baris berupa tuple EXPORT_COLUMNS."""
+    for mid in machine_ids:
+        # Posisi awal: semua baris dengan time >= start (id 0 < semua id)
+        cursor_time, cursor_id = start.strftime(TIME_FORMAT), 0
+        while True:
+            rows = conn.execute("""
+                SELECT machine_id, time, status, latency, rx, tx, id
+                FROM history
+                WHERE machine_id = ? AND (time > ? OR (time = ? AND id > ?)) AND time < ?
+                ORDER BY time, id LIMIT ?
+            """, (mid, cursor_time, cursor_time, cursor_id, end.strftime(TIME_FORMAT), chunk_size)).fetchall()
+            if not rows:
+                break
+            yield [tuple(r)[:-1] for r in rows]
+            if len(rows) < chunk_size:
+                break
+            cursor_time, cursor_id = rows[-1]['time'], rows[-1]['id']
+
+
+HEATMAP_METRICS = ('latency', 'availability')
+
+
+def heatmap_matrix(conn, machine_ids, start, end, resolution, metric='latency'):
+    """Matriks node x bucket waktu (latency rata-rata sample online, atau availability),
+    diagregasi dengan NumPy (bincount) dari satu query ber-index.
+    Hasil: {ids, base, resolution, buckets, metric, values[[...]]}, null = tanpa data."""
+    base = wall_epoch(start)
+    buckets = max(1, math.ceil((wall_epoch(end) - base) / resolution))
+    n = len(machine_ids)
+
+    # json_each.key = posisi node di list, langsung jadi index baris matriks
+    conn.row_factory = None
+    rows = conn.execute("""
+        SELECT j.key, CAST(strftime('%s', h.time) AS INTEGER), h.status = 'ONLINE', h.latency
+        FROM json_each(?) j
+        JOIN history h ON h.machine_id = j.value
+        WHERE h.time >= ? AND h.time < ?
+    """, (json.dumps(machine_ids), start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT))).fetchall()
+
+    data = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    node_idx = data[:, 0].astype(np.int64)
+    bucket = ((data[:, 1] - base) // resolution).astype(np.int64)
+    up = data[:, 2]
+
+    valid = (bucket >= 0) & (bucket < buckets)
+    flat = node_idx[valid] * buckets + bucket[valid]
+    size = n * buckets
+
+    up_count = np.bincount(flat, weights=up[valid], minlength=size)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'availability':
+            total = np.bincount(flat, minlength=size)
+            values = np.round(up_count / total, 4)
+        else:
+            lat_sum = np.bincount(flat, weights=(data[:, 3] * up)[valid], minlength=size)
+            values = np.round(lat_sum / up_count, 2)
+
+    matrix = values.reshape(n, buckets)
+    # NaN (bucket tanpa sample) -> null di JSON
+    out = [[None if v != v else v for v in row] for row in matrix.tolist()]
+
+    return {
+        "ids": machine_ids,
+        "base": base,
+        "resolution": resolution,
+        "buckets": buckets,
+        "metric": metric,
+        "values": out
+    }
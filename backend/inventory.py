@@ -0,0 +1,146 @@
+import base64
+import json
+
+# Query inventaris machine: filter, pencarian, sort & keyset pagination di sisi server.
+# Urutan selalu (kolom sort, id) supaya cursor stabil walau nilai sort kembar.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Ekspresi sort -> harus sama persis dengan ekspresi index di database.py
+SORT_COLUMNS = {
+    'id': None,
+    'status': 'online',
+    'latency': 'latency_ms',
+    'traffic': '(rx_rate + tx_rate)',
+}
+
+LIST_FIELDS = (
+    'id', 'host', 'type', 'icon', 'use_snmp', 'lat', 'lng', 'city', 'province',
+    'online', 'latency_ms', 'rx_rate', 'tx_rate', 'last_seen'
+)
+
+_fts_available = None
+
+
+class QueryError(ValueError):
+    pass
+
+
+def fts_available(conn):
+    """True jika tabel machines_fts berhasil dibuat (SQLite dengan FTS5)."""
+    global _fts_available
+    if _fts_available is None:
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='machines_fts'"
+        ).fetchone()
+        _fts_available = row is not None
+    return _fts_available
+
+
+def encode_cursor(value, mid):
+    raw = json.dumps([value, mid], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, mid = json.loads(raw)
+        return value, str(mid)
+    except (ValueError, TypeError):
+        raise QueryError("cursor tidak valid")
+
+
+def fts_query(text):
+    """Setiap kata menjadi prefix term FTS5 yang di-quote (AND antar kata)."""
+    terms = [t.replace('"', '""') for t in text.split()]
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+def build_filters(conn, provinces, status=None, type_=None, province=None, city=None, q=None):
+    """Klausa WHERE & parameter untuk filter listing. `provinces` None berarti admin."""
+    clauses, params = [], []
+
+    if provinces is not None:
+        clauses.append("province IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(sorted(provinces)))
+    if status == 'online':
+        clauses.append("online = 1")
+    elif status == 'offline':
+        clauses.append("online = 0")
+    elif status:
+        raise QueryError("status harus online atau offline")
+    if type_:
+        clauses.append("type = ?")
+        params.append(type_)
+    if province:
+        clauses.append("province = ?")
+        params.append(province)
+    if city:
+        clauses.append("city = ?")
+        params.append(city)
+
+    if q and q.strip():
+        if fts_available(conn):
+            clauses.append("rowid IN (SELECT rowid FROM machines_fts WHERE machines_fts MATCH ?)")
+            params.append(fts_query(q))
+        else:
+            # Fallback tanpa FTS5: pencarian prefix biasa
+            like = q.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            clauses.append("(id LIKE ? ESCAPE '\\' OR host LIKE ? ESCAPE '\\' OR city LIKE ? ESCAPE '\\')")
+            params.extend([like, like, like])
+
+    return clauses, params
+
+
+def query_machines(conn, provinces, sort='id', order='asc', limit=DEFAULT_PAGE_SIZE, cursor=None, **filters):
+    """Satu halaman machine. Hasil: {items, next_cursor, total}."""
+    if sort not in SORT_COLUMNS:
+        raise QueryError(f"sort harus salah satu dari: {', '.join(SORT_COLUMNS)}")
+    if order not in ('asc', 'desc'):
+        raise QueryError("order harus asc atau desc")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    clauses, params = build_filters(conn, provinces, **filters)
+    where = " AND ".join(clauses) if clauses else "1"
+    total = conn.execute(f"SELECT COUNT(*) FROM machines WHERE {where}", params).fetchone()[0]
+
+    expr = SORT_COLUMNS[sort]
+    op = '>' if order == 'asc' else '<'
+    direction = order.upper()
+    page_clauses, page_params = list(clauses), list(params)
+
+    if cursor:
+        value, mid = decode_cursor(cursor)
+        if expr is None:
+            page_clauses.append(f"id {op} ?")
+            page_params.append(mid)
+        else:
+            page_clauses.append(f"({expr}, id) {op} (?, ?)")
+            page_params.extend([value, mid])
+
+    order_by = f"id {direction}" if expr is None else f"{expr} {direction}, id {direction}"
+    sort_select = f", {expr} AS sort_value" if expr else ""
+    page_where = " AND ".join(page_clauses) if page_clauses else "1"
+
+    rows = conn.execute(f"""
+        SELECT {', '.join(LIST_FIELDS)}{sort_select}
+        FROM machines
+        WHERE {page_where}
+        ORDER BY {order_by}
+        LIMIT ?
+    """, page_params + [limit + 1]).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [{k: r[k] for k in LIST_FIELDS} for r in rows]
+    for item in items:
+        item['online'] = bool(item['online'])
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(last['sort_value'] if expr else None, last['id'])
+
+    return {"items": items, "next_cursor": next_cursor, "total": total}
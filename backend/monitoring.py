@@ -4,8 +4,15 @@ import platform
 import requests
 from datetime import datetime, timedelta
 from config import Config
-from database import get_db_connection
-from alerts import send_email_alert, check_cooldown, update_cooldown
+from database import get_db_connection, log_change
+from fleet import store
+from follower import follower
+from settings import settings
+from alerts import enqueue_email_alert, acquire_cooldown
+from alert_state import count_new_alert
+from alert_engine import engine
+from rules import FleetSnapshot, rule_engine, traffic_breaches, rule_message
+from baselines import baselines, anomaly_message
 
 def get_network_metrics():
     """Mengambil data bandwidth dari Prometheus"""
@@ -39,16 +46,37 @@ def get_network_metrics():
     
     return metrics
 
+def insert_app_alert(conn, node, alert_type, message, timestamp):
+    """Insert notifikasi dashboard; dipublish ke stream oleh follower setelah commit."""
+    cur = conn.execute("INSERT INTO app_alerts (machine_id, type, message, time) VALUES (?, ?, ?, ?)", 
+                       (node.id, alert_type, message, timestamp))
+    count_new_alert(conn, node.province)
+    return {
+        "id": cur.lastrowid,
+        "machine_id": node.id,
+        "type": alert_type,
+        "message": message,
+        "time": timestamp,
+        "host": node.host,
+        "city": node.city,
+        "province": node.province
+    }
+
 def update_machines_status():
+    store.ensure_loaded()
+    machines = store.list_nodes()
     conn = get_db_connection()
-    machines = conn.execute("SELECT * FROM machines").fetchall()
     prom_metrics = get_network_metrics()
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Threshold dari registry settings (memori), perubahan berlaku mulai siklus ini
+    threshold_kbps = settings.get('bandwidth_threshold')
+    cycle_samples = []
+    state_changes = []
 
     for m in machines:
-        mid, host = m['id'], m['host']
-        use_snmp = m['use_snmp']
-        prev_online_status = m['online']
+        mid, host = m.id, m.host
+        use_snmp = m.use_snmp
+        prev_online_status = m.online
         
         # 1. PING CHECK
         is_online = False
@@ -81,49 +109,71 @@ def update_machines_status():
 
         conn.execute("INSERT INTO history (machine_id, status, time, latency, rx, tx) VALUES (?, ?, ?, ?, ?, ?)", 
                      (mid, "ONLINE" if is_online else "OFFLINE", timestamp, latency, rx, tx))
+        cycle_samples.append((mid, timestamp, is_online, latency, rx, tx))
         
         # 4. ALERTS
         
-        # A. Node Down (State Change - Tidak butuh cooldown karena trigger by change)
-        if prev_online_status == 1 and not is_online:
-            msg = f"Node unreachable. Ping Timeout."
-            if m['notify_down']:
-                conn.execute("INSERT INTO app_alerts (machine_id, type, message, time) VALUES (?, ?, ?, ?)", 
-                             (mid, 'down', msg, timestamp))
-                
-            if m['notify_down'] and m['notify_email']:
-                send_email_alert(mid, 'down', msg)
-
-        # B. High Traffic (Continuous Value - BUTUH Cooldown)
-        threshold_kbps = Config.BANDWIDTH_THRESHOLD / 1000 
-        if is_online and use_snmp and m['notify_traffic']:
-            if rx > threshold_kbps or tx > threshold_kbps:
-                # [FIX] Cek Cooldown untuk Dashboard Alert
-                # Kita gunakan key khusus 'traffic_db' agar tidak bentrok dengan key email
-                if check_cooldown(mid, 'traffic_db'):
-                    msg = f"Traffic Spike: RX {rx} Kbps / TX {tx} Kbps"
-                    
-                    # 1. Masukkan notifikasi ke DB
-                    conn.execute("INSERT INTO app_alerts (machine_id, type, message, time) VALUES (?, ?, ?, ?)", 
-                                 (mid, 'traffic', msg, timestamp))
-                    
-                    # 2. Update cooldown DB agar tidak insert lagi dalam waktu dekat
-                    update_cooldown(mid, 'traffic_db')
-                    
-                    # 3. Kirim Email (send_email_alert punya cooldown sendiri dengan key 'traffic')
-                    if m['notify_email']:
-                        send_email_alert(mid, 'traffic', msg)
+        # A. Node Down (State Change): dievaluasi alert engine setelah semua node
+        # diprobe (flap detection & grouping down bersamaan)
+        # Probe pertama node baru bukan perubahan status (online=0 hanya default DB)
+        if bool(prev_online_status) != is_online and m.probed():
+            state_changes.append((m, is_online))
+
+    engine.evaluate(conn, state_changes, timestamp, insert_app_alert)
+
+    # B. Rule berbasis nilai, dievaluasi vektor terhadap snapshot kolom seluruh fleet
+    snap = FleetSnapshot(machines, cycle_samples)
+
+    # High Traffic (Continuous Value - BUTUH Cooldown)
+    for i in traffic_breaches(snap, threshold_kbps):
+        m = machines[i]
+        # Cek & set Cooldown (persisten) untuk Dashboard Alert
+        # Kita gunakan key khusus 'traffic_db' agar tidak bentrok dengan key email
+        if acquire_cooldown(conn, m.id, 'traffic_db'):
+            msg = f"Traffic Spike: RX {round(float(snap.values[1, i]), 2)} Kbps / TX {round(float(snap.values[2, i]), 2)} Kbps"
+            insert_app_alert(conn, m, 'traffic', msg, timestamp)
+
+            # Antrikan Email (outbox punya cooldown sendiri dengan key 'traffic')
+            if m.notify_email:
+                enqueue_email_alert(conn, m, 'traffic', msg)
+
+    # Rule dari tabel alert_rules: sekali per rangkaian N siklus berturut-turut
+    for rule, node, value, streak in rule_engine.evaluate(conn, snap):
+        msg = rule_message(rule, value, streak)
+        insert_app_alert(conn, node, 'rule', msg, timestamp)
+        if node.notify_email:
+            enqueue_email_alert(conn, node, f"rule{rule['id']}", msg)
+
+    # Anomali latency terhadap baseline EWMA per node (sekaligus update baseline)
+    for i, latency, mean, std in baselines.observe(conn, snap):
+        m = machines[i]
+        # Opt-in sama dengan alert down/flap (kualitas koneksi node)
+        if m.notify_down and acquire_cooldown(conn, m.id, 'anomaly'):
+            msg = anomaly_message(latency, mean, std)
+            insert_app_alert(conn, m, 'anomaly', msg, timestamp)
+            if m.notify_email:
+                enqueue_email_alert(conn, m, 'anomaly', msg)
 
     # Cleanup Old History
     cutoff = (datetime.now() - timedelta(days=Config.RETENTION_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
     conn.execute("DELETE FROM history WHERE time < ?", (cutoff,))
-    
+
+    # Siklus dicatat di fleet_log dalam transaksi yang sama dengan history-nya
+    last_id = conn.execute("SELECT MAX(id) FROM history").fetchone()[0] or 0
+    log_change(conn, 'cycle', ref_id=last_id)
     conn.commit()
     conn.close()
 
+    # Fleet store, index alert & stream SSE diupdate follower setelah commit
+    # (proses lain menerapkan entri log yang sama lewat follower masing-masing)
+    follower.poll()
+
 def monitor_loop():
     print("[*] Monitoring Service Started")
-    print(f"[*] Threshold: {Config.BANDWIDTH_THRESHOLD} bps | Recipient: {Config.ALERT_RECIPIENT}")
+    print(f"[*] Threshold: {settings.get('bandwidth_threshold')} Kbps | Recipient: {Config.ALERT_RECIPIENT}")
+    settings.subscribe(
+        lambda changed: print(f"[*] Threshold updated: {settings.get('bandwidth_threshold')} Kbps"),
+        ('bandwidth_threshold',))
     
     while True:
         try:
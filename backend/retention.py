@@ -0,0 +1,97 @@
+import time
+from datetime import datetime, timedelta
+from config import Config
+from database import get_db_connection
+from alert_state import adjust_counters
+
+# Retensi alert: alert lebih lama dari ALERT_RETENTION_DAYS dipindah ke
+# alert_archive (jumlah per node, per hari, per tipe) lalu dihapus per chunk
+# bersama pengecualian alert_status-nya. Halaman kosong dikembalikan ke OS
+# dengan incremental_vacuum sehingga tabel alert "panas" tetap kecil.
+
+# Jumlah halaman yang dibebaskan per langkah incremental_vacuum
+VACUUM_STEP_PAGES = 500
+# Entri fleet_log yang lebih tua dari ini dipangkas (follower yang tertinggal memuat ulang penuh)
+FLEET_LOG_KEEP = 86400
+
+
+def purge_chunk(conn, cutoff, chunk_size):
+    """Arsipkan & hapus satu chunk alert tertua sebelum cutoff. Mengembalikan id
+    tertinggi yang dihapus, atau None jika tidak ada lagi yang perlu dipurge.
+    Id alert naik seiring waktu, jadi chunk cukup diambil dari urutan id."""
+    upto = conn.execute("""
+        SELECT MAX(id) FROM (
+            SELECT id, time FROM app_alerts ORDER BY id LIMIT ?
+        ) WHERE time < ?
+    """, (chunk_size, cutoff)).fetchone()[0]
+    if upto is None:
+        return None
+
+    conn.execute("""
+        INSERT INTO alert_archive (machine_id, day, type, count)
+        SELECT machine_id, substr(time, 1, 10), type, COUNT(*)
+        FROM app_alerts
+        WHERE id <= ?
+        GROUP BY machine_id, substr(time, 1, 10), type
+        ON CONFLICT(machine_id, day, type) DO UPDATE SET count = count + excluded.count
+    """, (upto,))
+    # Counter badge dikurangi per user & provinsi (sebelum pengecualiannya dihapus)
+    adjust_counters(conn, "a.id <= ?", (upto,), -1)
+    # FOREIGN KEY ... ON DELETE CASCADE tidak aktif (PRAGMA foreign_keys off),
+    # jadi pengecualian per user dihapus eksplisit dalam transaksi yang sama
+    conn.execute("DELETE FROM alert_status WHERE alert_id <= ?", (upto,))
+    conn.execute("DELETE FROM app_alerts WHERE id <= ?", (upto,))
+    conn.commit()
+    return upto
+
+
+def reclaim_space(conn):
+    """Kembalikan halaman kosong ke OS sedikit demi sedikit (butuh auto_vacuum=INCREMENTAL).
+    Berhenti jika freelist tidak berkurang (mis. DB belum dimigrasi oleh init_db)."""
+    freed = 0
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free_pages:
+        # executescript menjalankan pragma sampai selesai (execute biasa hanya membebaskan satu halaman)
+        conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free_pages:
+            break
+        freed += free_pages - remaining
+        free_pages = remaining
+    return freed
+
+
+def purge_alerts(retention_days=None, chunk_size=None):
+    retention_days = Config.ALERT_RETENTION_DAYS if retention_days is None else retention_days
+    chunk_size = chunk_size or Config.ALERT_PURGE_CHUNK
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = get_db_connection()
+    purged_upto = None
+    try:
+        while True:
+            upto = purge_chunk(conn, cutoff, chunk_size)
+            if upto is None:
+                break
+            purged_upto = upto
+            # Beri jeda agar monitor loop tidak menunggu lock tulis terlalu lama
+            time.sleep(0.05)
+
+        conn.execute("DELETE FROM fleet_log WHERE created_at < ?", (time.time() - FLEET_LOG_KEEP,))
+        conn.commit()
+        freed = reclaim_space(conn)
+    finally:
+        conn.close()
+
+    if purged_upto is not None:
+        print(f"[*] Alert retention: alert <= #{purged_upto} diarsipkan, {freed} halaman dibebaskan")
+    return purged_upto
+
+
+def retention_loop():
+    while True:
+        try:
+            purge_alerts()
+        except Exception as e:
+            print(f"[!] Alert Retention Error: {e}")
+        time.sleep(Config.ALERT_PURGE_INTERVAL)
@@ -0,0 +1,192 @@
+import threading
+import numpy as np
+from database import get_db_connection
+
+# Rule alert deklaratif (tabel alert_rules), misalnya "latency > 200 ms selama
+# 3 siklus untuk provinsi X". Rule dikompilasi sekali menjadi array numpy dan
+# dievaluasi terhadap snapshot kolom seluruh fleet per siklus: satu operasi
+# matriks (rule x node) tanpa percabangan Python per node. Counter siklus
+# berturut-turut disimpan sebagai matriks yang dipetakan ulang saat rule/node berubah.
+
+# Baris matriks metrik per siklus. loss = 100 jika ping gagal (1 paket/siklus).
+METRICS = ('latency', 'rx', 'tx', 'loss')
+LOSS = METRICS.index('loss')
+METRIC_UNITS = {'latency': 'ms', 'rx': 'Kbps', 'tx': 'Kbps', 'loss': '%'}
+OPERATORS = ('>', '>=', '<', '<=')
+SCOPES = ('all', 'province', 'node')
+
+
+class RuleError(ValueError):
+    pass
+
+
+def validate_rule(data):
+    """Normalisasi body POST /api/admin/alert-rules. RuleError jika tidak valid."""
+    metric = data.get('metric')
+    if metric not in METRICS:
+        raise RuleError(f"metric harus salah satu dari {', '.join(METRICS)}")
+    op = data.get('op', '>')
+    if op not in OPERATORS:
+        raise RuleError(f"op harus salah satu dari {' '.join(OPERATORS)}")
+    scope = data.get('scope', 'all')
+    if scope not in SCOPES:
+        raise RuleError(f"scope harus salah satu dari {', '.join(SCOPES)}")
+    scope_value = (data.get('scope_value') or '').strip()
+    if scope != 'all' and not scope_value:
+        raise RuleError("scope_value wajib untuk scope province/node")
+    try:
+        threshold = float(data.get('threshold'))
+        consecutive = int(data.get('consecutive', 1))
+    except (TypeError, ValueError):
+        raise RuleError("threshold (angka) dan consecutive (bilangan bulat) wajib diisi")
+    if consecutive < 1:
+        raise RuleError("consecutive minimal 1")
+
+    return {
+        'name': (data.get('name') or '').strip() or f"{metric} {op} {threshold:g}",
+        'metric': metric, 'op': op, 'threshold': threshold, 'consecutive': consecutive,
+        'scope': scope, 'scope_value': scope_value if scope != 'all' else '',
+        'enabled': 1 if data.get('enabled', True) else 0,
+    }
+
+
+def remap(matrix, old_keys, new_keys, axis):
+    """Pindahkan baris/kolom counter mengikuti urutan key baru (key baru mulai dari 0)."""
+    old_pos = {k: i for i, k in enumerate(old_keys)}
+    src = np.array([old_pos.get(k, -1) for k in new_keys], dtype=np.int64)
+    shape = list(matrix.shape)
+    shape[axis] = len(new_keys)
+    out = np.zeros(shape, dtype=matrix.dtype)
+    keep = src >= 0
+    if keep.any():
+        if axis == 0:
+            out[keep] = matrix[src[keep]]
+        else:
+            out[:, keep] = matrix[:, src[keep]]
+    return out
+
+
+class FleetSnapshot:
+    """Snapshot kolom satu siklus monitor (urutan = urutan node diprobe)."""
+
+    def __init__(self, nodes, samples):
+        self.nodes = nodes
+        self.ids = tuple(n.id for n in nodes)
+        self.provinces = np.array([n.province or '' for n in nodes], dtype=object)
+        # Berubah jika node ditambah/dihapus/pindah provinsi (cakupan rule dihitung ulang)
+        self.layout = tuple(zip(self.ids, self.provinces.tolist()))
+        self.online = np.fromiter((s[2] for s in samples), dtype=bool, count=len(samples))
+        self.values = np.empty((len(METRICS), len(samples)), dtype=np.float64)
+        self.values[0] = np.fromiter((s[3] for s in samples), dtype=np.float64, count=len(samples))
+        self.values[1] = np.fromiter((s[4] for s in samples), dtype=np.float64, count=len(samples))
+        self.values[2] = np.fromiter((s[5] for s in samples), dtype=np.float64, count=len(samples))
+        self.values[LOSS] = np.where(self.online, 0.0, 100.0)
+
+    def flag(self, field):
+        return np.fromiter((bool(getattr(n, field)) for n in self.nodes), dtype=bool, count=len(self.nodes))
+
+
+class RuleEngine:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.signature = None
+        self.rules = []
+        self.rule_ids = ()
+        self.node_ids = ()
+        self.layout = ()
+        self.counts = np.zeros((0, 0), dtype=np.int32)
+        self.scope_mask = None
+
+    def _load(self, conn):
+        """Kompilasi ulang rule jika isi tabel alert_rules berubah (tabel kecil, dicek per siklus)."""
+        rows = conn.execute("SELECT * FROM alert_rules ORDER BY id").fetchall()
+        signature = tuple(tuple(r) for r in rows)
+        if signature == self.signature:
+            return
+        rules = [dict(r) for r in rows if r['enabled']]
+        rule_ids = tuple(r['id'] for r in rules)
+
+        self.counts = remap(self.counts, self.rule_ids, rule_ids, axis=0)
+        self.rules = rules
+        self.rule_ids = rule_ids
+        self.metric_idx = np.array([METRICS.index(r['metric']) for r in rules], dtype=np.int64)
+        self.thresholds = np.array([r['threshold'] for r in rules], dtype=np.float64)[:, None]
+        self.consecutive = np.array([r['consecutive'] for r in rules], dtype=np.int32)[:, None]
+        ops = np.array([r['op'] for r in rules], dtype=object)[:, None]
+        self.op_gt, self.op_ge, self.op_lt = ops == '>', ops == '>=', ops == '<'
+        # Metrik selain loss hanya berlaku saat node online (latency/rx/tx = 0 ketika offline)
+        self.needs_online = (self.metric_idx != LOSS)[:, None]
+        self.scope_mask = None
+        self.signature = signature
+        print(f"[*] Alert rules compiled: {len(rules)} rule aktif")
+
+    def _scope_mask(self, snap):
+        """Matriks (rule x node) cakupan rule, dihitung ulang hanya saat rule/node berubah."""
+        if self.scope_mask is not None:
+            return self.scope_mask
+        mask = np.zeros((len(self.rules), len(snap.ids)), dtype=bool)
+        ids = np.array(snap.ids, dtype=object)
+        for i, r in enumerate(self.rules):
+            if r['scope'] == 'all':
+                mask[i] = True
+            elif r['scope'] == 'province':
+                mask[i] = snap.provinces == r['scope_value']
+            else:
+                mask[i] = ids == r['scope_value']
+        self.scope_mask = mask
+        return mask
+
+    def evaluate(self, conn, snap):
+        """Mengembalikan list (rule, node, value, streak) untuk rule yang baru terpenuhi
+        tepat `consecutive` siklus berturut-turut (sekali per rangkaian pelanggaran)."""
+        with self.lock:
+            self._load(conn)
+            if snap.layout != self.layout:
+                if snap.ids != self.node_ids:
+                    self.counts = remap(self.counts, self.node_ids, snap.ids, axis=1)
+                    self.node_ids = snap.ids
+                self.layout = snap.layout
+                self.scope_mask = None
+            if not self.rules or not snap.ids:
+                return []
+
+            values = snap.values[self.metric_idx]
+            diff = values - self.thresholds
+            breach = np.where(self.op_gt, diff > 0,
+                     np.where(self.op_ge, diff >= 0,
+                     np.where(self.op_lt, diff < 0, diff <= 0)))
+            breach &= self._scope_mask(snap)
+            breach &= snap.online[None, :] | ~self.needs_online
+
+            self.counts = np.where(breach, self.counts + 1, 0).astype(np.int32)
+            rule_idx, node_idx = np.nonzero(self.counts == self.consecutive)
+            return [
+                (self.rules[r], snap.nodes[n], float(values[r, n]), int(self.counts[r, n]))
+                for r, n in zip(rule_idx.tolist(), node_idx.tolist())
+            ]
+
+
+def traffic_breaches(snap, threshold_kbps):
+    """Rule bawaan high traffic: node online ber-SNMP dengan notify_traffic dan
+    RX atau TX di atas threshold (Kbps). Mengembalikan index node."""
+    mask = snap.online & snap.flag('use_snmp') & snap.flag('notify_traffic')
+    mask &= (snap.values[1] > threshold_kbps) | (snap.values[2] > threshold_kbps)
+    return np.nonzero(mask)[0].tolist()
+
+
+def rule_message(rule, value, streak):
+    unit = METRIC_UNITS[rule['metric']]
+    # Angka ditulis seperti pesan traffic (2 desimal), bukan :g yang memakai notasi eksponen
+    return (f"Rule '{rule['name']}': {rule['metric']} {round(float(value), 2)} {unit} "
+            f"{rule['op']} {round(float(rule['threshold']), 2)} selama {streak} siklus")
+
+
+def list_rules():
+    conn = get_db_connection()
+    try:
+        return [dict(r) for r in conn.execute("SELECT * FROM alert_rules ORDER BY id").fetchall()]
+    finally:
+        conn.close()
+
+
+rule_engine = RuleEngine()
@@ -0,0 +1,119 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from database import init_db
+
+# Entry point produksi:
+#   python serve.py          -> supervisor: API (gunicorn, multi-worker gevent) + proses monitor
+#   python serve.py monitor  -> proses background (dijalankan oleh supervisor)
+# Monitor loop, deteksi HQ, sinkronisasi target Prometheus, retention dan email
+# dispatcher hanya berjalan di proses monitor, tepat sekali per deployment.
+# Worker API mengikuti perubahan state lewat fleet_log (lihat follower.py).
+# Mode development tetap: python app.py (semua dalam satu proses).
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Backoff restart child yang mati: 2, 4, 8, ... detik (maksimal RESTART_BACKOFF_MAX).
+# Child yang sempat hidup lebih lama dari RESTART_RESET_AFTER dianggap sehat lagi.
+RESTART_BACKOFF_MAX = 60
+RESTART_RESET_AFTER = 60
+# Batas waktu child berhenti dengan rapi saat shutdown sebelum di-kill
+SHUTDOWN_TIMEOUT = 30
+
+# Child dijalankan sebagai proses terpisah (bukan multiprocessing): master gunicorn
+# me-reap semua child-nya sendiri, jadi keduanya tidak boleh berbagi parent Python.
+CHILDREN = {
+    'api': [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BASE_DIR, 'gunicorn.conf.py'), 'app:app'],
+    'monitor': [sys.executable, os.path.join(BASE_DIR, 'serve.py'), 'monitor'],
+}
+
+
+class Child:
+    def __init__(self, name, cmd):
+        self.name = name
+        self.cmd = cmd
+        self.proc = None
+        self.started_at = 0
+        self.failures = 0
+        self.restart_at = 0
+
+    def start(self):
+        print(f"[*] Starting {self.name} process...")
+        self.proc = subprocess.Popen(self.cmd, cwd=BASE_DIR)
+        self.started_at = time.time()
+
+    def check(self, now):
+        """Restart child yang berhenti, dengan backoff eksponensial."""
+        if self.proc is not None:
+            code = self.proc.poll()
+            if code is None:
+                return
+            if now - self.started_at > RESTART_RESET_AFTER:
+                self.failures = 0
+            self.failures += 1
+            delay = min(2 ** self.failures, RESTART_BACKOFF_MAX)
+            print(f"[!] {self.name} process exited ({code}), restart dalam {delay}s")
+            self.proc = None
+            self.restart_at = now + delay
+        if now >= self.restart_at:
+            self.start()
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+
+    def wait(self, timeout):
+        if self.proc is None:
+            return
+        try:
+            self.proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print(f"[!] {self.name} process tidak berhenti, kill")
+            self.proc.kill()
+            self.proc.wait()
+
+
+def supervise():
+    # Migrasi skema sekali di sini, sebelum worker API dan monitor dijalankan
+    init_db()
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+
+    children = [Child(name, cmd) for name, cmd in CHILDREN.items()]
+    for child in children:
+        child.start()
+
+    while not stopping:
+        now = time.time()
+        for child in children:
+            child.check(now)
+        time.sleep(1)
+
+    print("[*] Shutting down...")
+    for child in children:
+        child.stop()
+    deadline = time.time() + SHUTDOWN_TIMEOUT
+    for child in children:
+        child.wait(max(0, deadline - time.time()))
+
+
+def run_monitor():
+    import app
+
+    # docker stop -> supervisor -> SIGTERM: keluar lewat atexit (snapshot disimpan)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    app.start_follower()
+    app.start_background()
+    while True:
+        time.sleep(3600)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['monitor']:
+        run_monitor()
+    else:
+        supervise()
@@ -0,0 +1,134 @@
+import threading
+from config import Config
+from database import get_db_connection, log_change
+
+# Registry setting (tabel settings) yang dimuat sekali ke memori dengan tipe
+# yang jelas. Perubahan lewat update() langsung ditulis ke DB dan diteruskan
+# ke subscriber (monitor, HQ, dll) sehingga tidak ada query di hot path.
+# Proses lain menerima perubahan lewat fleet_log -> follower -> refresh().
+
+# key -> (tipe, default)
+SETTING_TYPES = {
+    'latency_threshold': (int, 100),                              # ms
+    'bandwidth_threshold': (int, Config.BANDWIDTH_THRESHOLD // 1000),  # Kbps
+    'hq_manual': (bool, False),
+    'hq_lat': (float, 0.0),
+    'hq_lng': (float, 0.0),
+    'hq_city': (str, 'Manual Location'),
+    'hq_region': (str, ''),
+    'hq_country': (str, ''),
+    # HQ hasil auto-detect terakhir (JSON, termasuk detected_at), diisi proses monitor
+    'hq_detected': (str, ''),
+}
+
+
+def parse_value(key, raw):
+    type_, default = SETTING_TYPES[key]
+    if raw is None:
+        return default
+    try:
+        if type_ is bool:
+            return str(raw).lower() in ('1', 'true', 'yes')
+        return type_(raw)
+    except (TypeError, ValueError):
+        print(f"[!] Setting '{key}' tidak valid ({raw!r}), memakai default {default!r}")
+        return default
+
+
+def serialize_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return str(value)
+
+
+class SettingsRegistry:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.values = {}
+        self.loaded = False
+        self.subscribers = []
+
+    def load(self):
+        conn = get_db_connection()
+        try:
+            rows = conn.execute("SELECT key, value FROM settings").fetchall()
+        finally:
+            conn.close()
+
+        raw = {r['key']: r['value'] for r in rows}
+        with self.lock:
+            self.values = {key: parse_value(key, raw.get(key)) for key in SETTING_TYPES}
+            self.loaded = True
+
+    def refresh(self):
+        """Muat ulang dari DB (diubah proses lain) dan beri tahu subscriber key yang berubah."""
+        if not self.loaded:
+            return self.load()
+        with self.lock:
+            before = dict(self.values)
+            self.load()
+            changed = {k for k, v in self.values.items() if before.get(k) != v}
+        self._notify(changed)
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.load()
+
+    def get(self, key):
+        self.ensure_loaded()
+        return self.values[key]
+
+    def snapshot(self, keys=None):
+        self.ensure_loaded()
+        with self.lock:
+            return {k: self.values[k] for k in (keys or SETTING_TYPES)}
+
+    def update(self, changes):
+        """Validasi & simpan beberapa setting dalam satu transaksi, lalu beri tahu subscriber.
+        ValueError jika key tidak dikenal atau nilai tidak sesuai tipe."""
+        self.ensure_loaded()
+        parsed = {}
+        for key, value in changes.items():
+            if key not in SETTING_TYPES:
+                raise ValueError(f"Setting tidak dikenal: {key}")
+            type_ = SETTING_TYPES[key][0]
+            parsed[key] = parse_value(key, value) if type_ is bool else type_(value)
+
+        with self.lock:
+            conn = get_db_connection()
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                    [(k, serialize_value(v)) for k, v in parsed.items()])
+                log_change(conn, 'settings')
+                conn.commit()
+            finally:
+                conn.close()
+
+            changed = {k for k, v in parsed.items() if self.values.get(k) != v}
+            self.values.update(parsed)
+
+        self._notify(changed)
+        return changed
+
+    def _notify(self, changed):
+        if not changed:
+            return
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for keys, callback in subscribers:
+            if keys is None or changed & keys:
+                try:
+                    callback(changed)
+                except Exception as e:
+                    print(f"[!] Settings subscriber error: {e}")
+
+    def subscribe(self, callback, keys=None):
+        """callback(changed_keys) dipanggil setelah setting pada `keys` berubah."""
+        with self.lock:
+            self.subscribers.append((frozenset(keys) if keys else None, callback))
+
+
+settings = SettingsRegistry()
@@ -0,0 +1,86 @@
+import gzip
+import json
+import os
+import time
+from config import Config
+from database import get_db_connection
+from fleet import store
+
+# Versi format file snapshot. Naikkan jika struktur payload berubah.
+SNAPSHOT_VERSION = 1
+
+# Isi file snapshot yang dibaca saat startup (dibaca sekali saja)
+_loaded = None
+
+def load_snapshot():
+    """Membaca file snapshot sekali dan menyimpannya di memori."""
+    global _loaded
+    if _loaded is not None:
+        return _loaded
+
+    _loaded = {}
+    if not os.path.exists(Config.SNAPSHOT_FILE):
+        return _loaded
+
+    try:
+        with gzip.open(Config.SNAPSHOT_FILE, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') == SNAPSHOT_VERSION:
+            _loaded = data
+        else:
+            print(f"[!] Snapshot version mismatch ({data.get('version')}), ignored.")
+    except Exception as e:
+        print(f"[!] Failed to read snapshot: {e}")
+
+    return _loaded
+
+def restore_snapshot():
+    """Memuat fleet store (dengan sample dari snapshot) saat startup.
+    Cooldown alert (tabel alert_cooldowns) dan HQ hasil deteksi (settings hq_detected)
+    persisten di DB, bukan di snapshot."""
+    data = load_snapshot()
+    if not data:
+        store.load()
+        return
+
+    # Sample hanya dipakai jika DB tidak punya history yang lebih baru dari snapshot
+    conn = get_db_connection()
+    try:
+        last_id = conn.execute("SELECT MAX(id) FROM history").fetchone()[0] or 0
+    finally:
+        conn.close()
+
+    warm_samples = {}
+    if last_id == data.get('last_history_id'):
+        warm_samples = data.get('nodes', {})
+    else:
+        print("[*] Snapshot history is stale, samples will be loaded from DB.")
+
+    store.load(warm_samples=warm_samples)
+    print(f"[*] Snapshot restored: {len(warm_samples)} nodes.")
+
+def save_snapshot():
+    if not store.loaded:
+        return
+    nodes, last_id = store.export_samples()
+
+    payload = {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "last_history_id": last_id,
+        "nodes": nodes,
+    }
+
+    tmp_path = Config.SNAPSHOT_FILE + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(Config.SNAPSHOT_FILE), exist_ok=True)
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        os.replace(tmp_path, Config.SNAPSHOT_FILE)
+    except Exception as e:
+        print(f"[!] Failed to save snapshot: {e}")
+
+def snapshot_loop():
+    while True:
+        time.sleep(Config.SNAPSHOT_INTERVAL)
+        save_snapshot()
@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+import json
+import threading
+from functools import lru_cache
+from fleet import store
+
+# Batas waktu menunggu build dari request lain sebelum build sendiri
+BUILD_WAIT_TIMEOUT = 10
+
+
+class StatusEntry:
+    __slots__ = ('version', 'etag', 'body', 'gzip_body', 'mimetype')
+
+    def __init__(self, version, etag, body, gzip_body, mimetype):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.gzip_body = gzip_body
+        self.mimetype = mimetype
+
+
+class StatusCache:
+    """Cache /api/status yang sudah diserialisasi & dikompres, per scope akses.
+    Dibangun ulang hanya saat versi fleet store berubah (sekali per siklus monitor)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.building = {}
+
+    def get(self, scope_key, build_fn, mimetype='application/json'):
+        """build_fn dipanggil dengan store.lock terpegang dan mengembalikan data JSON
+        (atau bytes yang sudah diserialisasi, misalnya format biner)."""
+        while True:
+            with self.lock:
+                entry = self.entries.get(scope_key)
+                if entry is not None and entry.version == store.version:
+                    return entry
+
+                pending = self.building.get(scope_key)
+                if pending is None:
+                    pending = self.building[scope_key] = threading.Event()
+                    break
+
+            # Request identik lain sedang build, tunggu hasilnya
+            if not pending.wait(BUILD_WAIT_TIMEOUT):
+                return self._build(scope_key, build_fn, mimetype)
+
+        try:
+            entry = self._build(scope_key, build_fn, mimetype)
+            with self.lock:
+                self.entries[scope_key] = entry
+                # Buang entry scope lain yang sudah basi
+                for key in [k for k, e in self.entries.items() if e.version != entry.version]:
+                    del self.entries[key]
+            return entry
+        finally:
+            with self.lock:
+                self.building.pop(scope_key, None)
+            pending.set()
+
+    def _build(self, scope_key, build_fn, mimetype):
+        with store.lock:
+            version = store.version
+            data = build_fn()
+
+        if isinstance(data, bytes):
+            body = data
+        else:
+            body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        scope_hash = hashlib.sha1(scope_key.encode('utf-8')).hexdigest()[:10]
+        etag = f"{store.epoch}-{version}-{scope_hash}"
+        return StatusEntry(version, etag, body, gzip.compress(body, compresslevel=6), mimetype)
+
+
+@lru_cache(maxsize=256)
+def scope_key_for(provinces):
+    if provinces is None:
+        return "admin"
+    return "p:" + "|".join(sorted(provinces))
+
+
+status_cache = StatusCache()
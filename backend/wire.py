@@ -0,0 +1,107 @@
+import json
+import struct
+from array import array
+from datetime import datetime, timezone
+
+# Format kolom (opt-in) untuk payload history & status.
+# - columnar JSON : satu base epoch + offset detik, array per metrik, status di-encode dictionary
+# - binary        : header JSON + blok array little-endian (uint32/float32/uint8)
+#
+# Waktu history disimpan sebagai waktu lokal server tanpa timezone, sehingga
+# epoch di sini adalah "wall clock" server: decode di browser dengan fungsi UTC.
+
+COLUMNAR_JSON_MIME = "application/vnd.repinger.columnar+json"
+COLUMNAR_BINARY_MIME = "application/vnd.repinger.columnar"
+BINARY_MAGIC = b"RPC1"
+
+STATUS_DICT = ["ONLINE", "OFFLINE"]
+_STATUS_CODE = {s: i for i, s in enumerate(STATUS_DICT)}
+
+
+def negotiate_format(req, explicit=None):
+    """'rows' (default, format lama), 'columnar' atau 'binary'.
+    Query/body parameter `format` didahulukan, lalu header Accept."""
+    fmt = explicit or req.args.get('format')
+    if fmt in ('rows', 'columnar', 'binary'):
+        return fmt
+
+    accept = req.headers.get('Accept', '')
+    if COLUMNAR_JSON_MIME in accept:
+        return 'columnar'
+    if COLUMNAR_BINARY_MIME in accept:
+        return 'binary'
+    return 'rows'
+
+
+def _epoch(time_str):
+    return int(datetime.fromisoformat(time_str).replace(tzinfo=timezone.utc).timestamp())
+
+
+def encode_series(rows):
+    """rows: list dict {time, status, latency, rx, tx} urut waktu."""
+    if not rows:
+        return {"base": 0, "t": [], "status": [], "latency": [], "rx": [], "tx": []}
+
+    epochs = [_epoch(r['time']) for r in rows]
+    base = min(epochs)
+    return {
+        "base": base,
+        "t": [e - base for e in epochs],
+        "status": [_STATUS_CODE.get(r['status'], 1) for r in rows],
+        "latency": [r['latency'] or 0 for r in rows],
+        "rx": [r['rx'] or 0 for r in rows],
+        "tx": [r['tx'] or 0 for r in rows]
+    }
+
+
+def _pack_series(series):
+    """Blok biner satu series. Setiap array dimulai di offset kelipatan 4
+    agar bisa langsung dibaca sebagai typed array di browser."""
+    n = len(series['t'])
+    status = bytes(series['status'])
+    padding = b"\0" * (-n % 4)
+    return b"".join([
+        array('I', series['t']).tobytes(),
+        array('f', series['latency']).tobytes(),
+        array('f', series['rx']).tobytes(),
+        array('f', series['tx']).tobytes(),
+        status, padding
+    ])
+
+
+def pack_binary(meta, series_list):
+    """Frame biner: magic | uint32 panjang header | header JSON (+padding) | blok series.
+    Header berisi meta dan base/n tiap series, urut sesuai blok."""
+    header = dict(meta)
+    header['status_dict'] = STATUS_DICT
+    header['series'] = [{"base": s['base'], "n": len(s['t'])} for s in series_list]
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b" " * (-len(header_bytes) % 4)
+
+    parts = [BINARY_MAGIC, struct.pack('<I', len(header_bytes)), header_bytes]
+    parts.extend(_pack_series(s) for s in series_list)
+    return b"".join(parts)
+
+
+def history_payload(rows, fmt):
+    """Payload /api/history dalam format terpilih: (body, mimetype)."""
+    if fmt == 'binary':
+        return pack_binary({}, [encode_series(rows)]), COLUMNAR_BINARY_MIME
+
+    series = encode_series(rows)
+    series['status_dict'] = STATUS_DICT
+    return json.dumps(series, separators=(',', ':')).encode('utf-8'), COLUMNAR_JSON_MIME
+
+
+def status_payload(machines, fmt):
+    """Payload /api/status penuh: history tiap machine diganti bentuk kolom."""
+    if fmt == 'binary':
+        meta = {"machines": [{k: v for k, v in m.items() if k != 'history'} for m in machines]}
+        return pack_binary(meta, [encode_series(m['history']) for m in machines])
+
+    out = []
+    for m in machines:
+        m = dict(m)
+        m['history'] = encode_series(m['history'])
+        out.append(m)
+    return {"status_dict": STATUS_DICT, "machines": out}